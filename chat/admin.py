@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatMessage
+from .models import ChatCacheEntry, ChatMessage
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
@@ -8,3 +8,10 @@ class ChatMessageAdmin(admin.ModelAdmin):
     search_fields = ('message', 'response', 'user__username')
     readonly_fields = ('timestamp',)
     ordering = ('-timestamp',)
+
+@admin.register(ChatCacheEntry)
+class ChatCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('prompt', 'model', 'hits', 'last_hit_at', 'expires_at')
+    search_fields = ('prompt', 'response')
+    readonly_fields = ('key', 'system_hash', 'created_at')
+    ordering = ('-hits',)
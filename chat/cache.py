@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ChatCacheEntry
+
+logger = logging.getLogger('chat.cache')
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MEMORY_ENTRIES = 500
+DEFAULT_DB_ENTRIES = 10000
+DEFAULT_MAX_PROMPT_LENGTH = 300
+DEFAULT_METRICS_EVERY = 1000
+# The table is pruned (expired rows, other system prompts, LRU overflow)
+# once per process and then every this many stores
+PRUNE_EVERY = 100
+# Columns refreshed when a reply is stored again under an existing key
+UPSERT_FIELDS = ['prompt', 'response', 'system_hash', 'model', 'expires_at', 'last_hit_at']
+LOOKUP_OUTCOMES = ('memory_hits', 'db_hits', 'misses')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# Prompts that talk about the user's own work or carry personal details
+# get an answer meant for them alone, so they are never shared
+_PERSONAL_RE = re.compile(
+    r"\b(my|mine|our|i'm|i am|me)\b"
+    r'|https?://|www\.|\S+@\S+\.\w+'
+    r'|\d{3,}',
+    re.IGNORECASE
+)
+
+
+def normalize_prompt(prompt):
+    """Case, spacing and trailing punctuation do not change the answer"""
+    return _WHITESPACE_RE.sub(' ', prompt.casefold()).strip().rstrip('?!. ')
+
+
+def is_cacheable(prompt, user=None):
+    """Only short, generic prompts are answered from the shared cache"""
+    if len(prompt) > getattr(settings, 'CHAT_CACHE_MAX_PROMPT_LENGTH', DEFAULT_MAX_PROMPT_LENGTH):
+        return False
+    if _PERSONAL_RE.search(prompt):
+        return False
+    if user is not None:
+        names = {user.username, user.first_name, user.last_name}
+        text = prompt.casefold()
+        if any(name and name.casefold() in text for name in names):
+            return False
+    return True
+
+
+def system_hash(system_prompt):
+    return hashlib.sha256(system_prompt.encode()).hexdigest()
+
+
+def cache_key(prompt, system_prompt, model):
+    """Key on the normalized prompt, system prompt and model together"""
+    payload = json.dumps([normalize_prompt(prompt), system_hash(system_prompt), model])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of chat replies: an in-process LRU over a table.
+
+    The memory tier answers repeats within a worker without a query; the
+    table shares answers between workers and survives restarts. Entries
+    expire after CHAT_CACHE_TTL seconds. Because the key includes a hash of
+    the system prompt, changing SYSTEM_PROMPT makes every old entry
+    unreachable, and the next prune deletes their rows.
+    """
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or getattr(settings, 'CHAT_CACHE_MEMORY_ENTRIES', DEFAULT_MEMORY_ENTRIES)
+        self.ttl = ttl or getattr(settings, 'CHAT_CACHE_TTL', DEFAULT_TTL)
+        self.metrics_every = getattr(settings, 'CHAT_CACHE_METRICS_EVERY', DEFAULT_METRICS_EVERY)
+        self.stats = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    def metrics(self):
+        """Hit/miss counters for this process, with the overall hit rate"""
+        lookups = self.stats['memory_hits'] + self.stats['db_hits'] + self.stats['misses']
+        # A semantic hit follows an exact miss, so it is already a lookup
+        hits = self.stats['memory_hits'] + self.stats['db_hits'] + self.stats['semantic_hits']
+        return {**self.stats, 'lookups': lookups, 'hit_rate': hits / lookups if lookups else 0.0}
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def _memory_set(self, key, response, ttl):
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _record(self, outcome, key):
+        self.stats[outcome] += 1
+        logger.debug('chat cache %s for %s', outcome, key[:12])
+        if outcome in LOOKUP_OUTCOMES and self.metrics_every:
+            lookups = sum(self.stats[name] for name in LOOKUP_OUTCOMES)
+            if lookups % self.metrics_every == 0:
+                self.log_metrics()
+
+    def log_metrics(self):
+        metrics = self.metrics()
+        logger.info(
+            'chat cache: %d lookups, hit rate %.1f%% (%s)',
+            metrics['lookups'], metrics['hit_rate'] * 100,
+            ', '.join(f'{name} {count}' for name, count in sorted(self.stats.items()))
+        )
+
+    def _promote(self, key, entry):
+        remaining = (entry.expires_at - timezone.now()).total_seconds()
+        self._memory_set(key, entry.response, remaining)
+
+    def get(self, key, record=True):
+        """Cached reply for `key`, or None; `record` False leaves the counters alone"""
+        response = self._memory_get(key)
+        if response is not None:
+            if record:
+                self._record('memory_hits', key)
+            return response
+        entry = ChatCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).only('response', 'expires_at').first()
+        if entry is None:
+            if record:
+                self._record('misses', key)
+            return None
+        ChatCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+        self._promote(key, entry)
+        if record:
+            self._record('db_hits', key)
+        return entry.response
+
+    async def aget(self, key):
+        response = self._memory_get(key)
+        if response is not None:
+            self._record('memory_hits', key)
+            return response
+        entry = await ChatCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).only('response', 'expires_at').afirst()
+        if entry is None:
+            self._record('misses', key)
+            return None
+        await ChatCacheEntry.objects.filter(pk=entry.pk).aupdate(hits=F('hits') + 1, last_hit_at=timezone.now())
+        self._promote(key, entry)
+        self._record('db_hits', key)
+        return entry.response
+
+    def _entry(self, key, prompt, response, system_prompt, model):
+        now = timezone.now()
+        return ChatCacheEntry(
+            key=key,
+            prompt=normalize_prompt(prompt),
+            response=response,
+            system_hash=system_hash(system_prompt),
+            model=model,
+            expires_at=now + timedelta(seconds=self.ttl),
+            last_hit_at=now,
+        )
+
+    def _should_prune(self):
+        with self._lock:
+            self._stores += 1
+            return self._stores % PRUNE_EVERY == 1
+
+    def set(self, key, prompt, response, system_prompt, model):
+        """Store a reply in both tiers; the row is upserted in one query"""
+        self._memory_set(key, response, self.ttl)
+        ChatCacheEntry.objects.bulk_create(
+            [self._entry(key, prompt, response, system_prompt, model)],
+            update_conflicts=True, unique_fields=['key'], update_fields=UPSERT_FIELDS
+        )
+        self.stats['stores'] += 1
+        if self._should_prune():
+            self.prune(system_prompt)
+
+    async def aset(self, key, prompt, response, system_prompt, model):
+        self._memory_set(key, response, self.ttl)
+        await ChatCacheEntry.objects.abulk_create(
+            [self._entry(key, prompt, response, system_prompt, model)],
+            update_conflicts=True, unique_fields=['key'], update_fields=UPSERT_FIELDS
+        )
+        self.stats['stores'] += 1
+        if self._should_prune():
+            await sync_to_async(self.prune)(system_prompt)
+
+    def prune(self, system_prompt):
+        """Delete expired rows, rows for other system prompts and LRU overflow"""
+        ChatCacheEntry.objects.filter(
+            Q(expires_at__lte=timezone.now()) | ~Q(system_hash=system_hash(system_prompt))
+        ).delete()
+        limit = getattr(settings, 'CHAT_CACHE_DB_ENTRIES', DEFAULT_DB_ENTRIES)
+        cutoff = ChatCacheEntry.objects.order_by('-last_hit_at').values_list('last_hit_at', flat=True)[limit:limit + 1].first()
+        if cutoff is not None:
+            ChatCacheEntry.objects.filter(last_hit_at__lte=cutoff).delete()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return ChatCacheEntry.objects.all().delete()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide ResponseCache, or None when CHAT_CACHE_ENABLED is off"""
+    global _cache
+    if not getattr(settings, 'CHAT_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
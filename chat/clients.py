@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+import ollama
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_HOST = 'http://localhost:11434'
+DEFAULT_MODEL = 'llama3:8b'
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_POOL_SIZE = 10
+DEFAULT_KEEP_ALIVE = '30m'
+
+_lock = threading.Lock()
+_clients = {}
+# httpx async pools belong to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def ollama_host():
+    return getattr(settings, 'OLLAMA_HOST', DEFAULT_HOST)
+
+
+def ollama_model():
+    return getattr(settings, 'OLLAMA_MODEL', DEFAULT_MODEL)
+
+
+def chat_options():
+    """Keyword arguments every chat call shares: the model and keep_alive.
+
+    keep_alive tells Ollama how long to keep the model loaded after a
+    request, so the next one does not pay for reloading several GB of
+    weights.
+    """
+    return {
+        'model': ollama_model(),
+        'keep_alive': getattr(settings, 'OLLAMA_KEEP_ALIVE', DEFAULT_KEEP_ALIVE),
+    }
+
+
+def _client_kwargs():
+    pool_size = getattr(settings, 'OLLAMA_POOL_SIZE', DEFAULT_POOL_SIZE)
+    return {
+        'timeout': httpx.Timeout(
+            getattr(settings, 'OLLAMA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+            connect=getattr(settings, 'OLLAMA_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        ),
+        'limits': httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    }
+
+
+def get_client(host=None):
+    """Process-wide ollama.Client for `host`, reusing its connection pool"""
+    host = host or ollama_host()
+    client = _clients.get(host)
+    if client is None:
+        with _lock:
+            client = _clients.get(host)
+            if client is None:
+                client = _clients[host] = ollama.Client(host=host, **_client_kwargs())
+    return client
+
+
+def get_async_client(host=None):
+    """ollama.AsyncClient for `host`, shared by every task on the running loop"""
+    host = host or ollama_host()
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None:
+        client = clients[host] = ollama.AsyncClient(host=host, **_client_kwargs())
+    return client
+
+
+@receiver(setting_changed)
+def reset_clients(setting, **kwargs):
+    """Drop cached clients when their settings change (e.g. in tests)"""
+    if setting.startswith('OLLAMA_'):
+        with _lock:
+            _clients.clear()
+            _async_clients.clear()
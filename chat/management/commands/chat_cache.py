@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from chat.cache import ResponseCache
+from chat.models import ChatCacheEntry
+from chat.semantic import get_semantic_cache
+from chat.views import SYSTEM_PROMPT
+
+class Command(BaseCommand):
+    help = 'Prunes the shared chat reply cache, compacts its semantic index and reports how often it is hit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Delete every cached reply')
+
+    def handle(self, *args, **options):
+        cache = ResponseCache()
+        semantic = get_semantic_cache()
+        if options['clear']:
+            cleared = cache.clear()
+            if semantic is not None:
+                semantic.compact(SYSTEM_PROMPT)
+            self.stdout.write(self.style.SUCCESS(f'Successfully cleared {cleared} cached replies'))
+            return
+
+        cache.prune(SYSTEM_PROMPT)
+        if semantic is not None:
+            kept, dropped = semantic.compact(SYSTEM_PROMPT)
+            self.stdout.write(f'Semantic index: kept {kept} prompts, dropped {dropped}')
+        entries = ChatCacheEntry.objects.count()
+        hits = ChatCacheEntry.objects.aggregate(total=Sum('hits'))['total'] or 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully pruned the chat cache: {entries} replies, served {hits} times'
+            )
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('prompt', models.TextField()),
+                ('response', models.TextField()),
+                ('model', models.CharField(max_length=100)),
+                ('system_hash', models.CharField(db_index=True, max_length=64)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('last_hit_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'chat cache entries',
+            },
+        ),
+    ]
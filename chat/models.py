@@ -9,3 +9,22 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+
+
+class ChatCacheEntry(models.Model):
+    """A reply shared between users who send the same generic prompt"""
+    key = models.CharField(max_length=64, unique=True)
+    prompt = models.TextField()
+    response = models.TextField()
+    model = models.CharField(max_length=100)
+    system_hash = models.CharField(max_length=64, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_hit_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'chat cache entries'
+
+    def __str__(self):
+        return self.prompt[:50]
@@ -0,0 +1,289 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache import system_hash
+from .clients import get_client, ollama_model
+from .models import ChatCacheEntry
+
+try:
+    import numpy as np
+except ImportError:  # optional: without it the semantic cache stays off
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; appends are then only serialized per process
+    fcntl = None
+
+DEFAULT_EMBEDDER = 'chat.semantic.OllamaEmbedder'
+DEFAULT_EMBED_MODEL = 'nomic-embed-text'
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_COMPACT_EVERY = 1000
+DEFAULT_HASHING_DIMENSIONS = 512
+# Neighbours tried in turn, so a stale row cannot hide a live one behind it
+SEARCH_CANDIDATES = 5
+# Prompt embeddings kept between lookup and store, so a miss embeds once
+PENDING_EMBEDDINGS = 256
+
+KEY_BYTES = 64
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def semantic_available():
+    return np is not None and getattr(settings, 'CHAT_SEMANTIC_CACHE', False)
+
+
+class OllamaEmbedder:
+    """Embeds text with the Ollama embeddings endpoint"""
+
+    def __init__(self):
+        self.model = getattr(settings, 'CHAT_EMBED_MODEL', DEFAULT_EMBED_MODEL)
+
+    def embed(self, text):
+        response = get_client().embed(model=self.model, input=text)
+        return np.asarray(response['embeddings'][0], dtype=np.float32)
+
+
+class HashingEmbedder:
+    """Local stand-in for tests and development: hashed words and trigrams.
+
+    Needs no model server. It only catches rewordings that share most of
+    their words, so production should use an embedding model.
+    """
+
+    model = 'hashing'
+
+    def __init__(self, dimensions=DEFAULT_HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _WORD_RE.findall(text.casefold()):
+            padded = f' {word} '
+            features = [word] + [padded[i:i + 3] for i in range(len(padded) - 2)]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                vector[int.from_bytes(digest, 'little') % self.dimensions] += 1.0
+        return vector
+
+
+class SemanticIndex:
+    """Append-only matrix of prompt embeddings, memory-mapped for search.
+
+    Each record is a cache key followed by the unit-length embedding, so
+    cosine similarity against every past prompt is one matrix-vector
+    product over the mapped file. Appends go to the end of the file under
+    a lock and the map is refreshed when the file grows. Compaction
+    rewrites the file without rows whose cache entry is gone and swaps it
+    in with os.replace, so readers never see a half-written index.
+
+    Files are named after the namespace (system prompt and chat model) and
+    the embedding size; changing either starts a fresh index.
+    """
+
+    def __init__(self, directory, namespace, dimensions):
+        self.dimensions = dimensions
+        self.dtype = np.dtype([('key', f'S{KEY_BYTES}'), ('vector', '<f4', (dimensions,))])
+        self.directory = str(directory)
+        self.prefix = f'index-{namespace[:16]}-'
+        self.path = os.path.join(self.directory, f'{self.prefix}{dimensions}.bin')
+        self._lock = threading.Lock()
+        self._map = None
+        self._map_id = None
+        self.appended = 0
+
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return _FileLock(os.path.join(self.directory, '.lock'), self._lock)
+
+    def records(self):
+        """The mapped records, remapped if another process changed the file"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        rows = st.st_size // self.dtype.itemsize
+        if rows == 0:
+            return None
+        map_id = (st.st_ino, rows)
+        if map_id != self._map_id:
+            # A torn trailing record from an interrupted append is left out
+            self._map = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(rows,))
+            self._map_id = map_id
+        return self._map
+
+    def search(self, vector, threshold, candidates=SEARCH_CANDIDATES):
+        """Keys of the nearest past prompts at or above `threshold`, best first"""
+        records = self.records()
+        if records is None:
+            return []
+        scores = records['vector'] @ vector
+        if len(scores) > candidates:
+            top = np.argpartition(scores, -candidates)[-candidates:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(scores[top])[::-1]]
+        return [records['key'][i].decode() for i in top if scores[i] >= threshold]
+
+    def append(self, key, vector):
+        record = np.zeros(1, dtype=self.dtype)
+        record['key'] = key.encode()
+        record['vector'] = vector
+        with self._locked():
+            with open(self.path, 'ab') as f:
+                # Realign if an earlier append was cut short
+                f.truncate(f.tell() - f.tell() % self.dtype.itemsize)
+                f.write(record.tobytes())
+        self.appended += 1
+
+    def compact(self, live_keys):
+        """Rewrite the index keeping the newest row of each live key.
+
+        `live_keys` is called with a list of keys and returns the subset
+        still in the cache. Index files for other namespaces are removed.
+        Returns (rows kept, rows dropped).
+        """
+        with self._locked():
+            for name in os.listdir(self.directory):
+                if name.startswith('index-') and not name.startswith(self.prefix):
+                    os.remove(os.path.join(self.directory, name))
+            records = self.records()
+            if records is None:
+                return 0, 0
+            keys = [key.decode() for key in records['key']]
+            live = live_keys(keys)
+            newest = {key: i for i, key in enumerate(keys) if key in live}
+            keep = np.array(sorted(newest.values()), dtype=np.int64)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(np.ascontiguousarray(records[keep]).tobytes())
+            os.replace(tmp_path, self.path)
+        self.appended = 0
+        return len(keep), len(records) - len(keep)
+
+
+class _FileLock:
+    """Thread lock plus an advisory file lock shared with other workers"""
+
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+        self.lock.release()
+
+
+def live_cache_keys(keys, batch_size=500):
+    """The subset of `keys` that still has a ChatCacheEntry row"""
+    found = set()
+    for start in range(0, len(keys), batch_size):
+        found.update(ChatCacheEntry.objects.filter(key__in=keys[start:start + batch_size]).values_list('key', flat=True))
+    return found
+
+
+class SemanticCache:
+    """Finds cached replies to paraphrases of earlier prompts.
+
+    Sits behind the exact-match ResponseCache: a prompt that misses there
+    is embedded and compared with every cached prompt, and the reply of the
+    closest one is reused when their cosine similarity reaches
+    CHAT_SEMANTIC_THRESHOLD. Replies themselves stay in ChatCacheEntry; the
+    index only maps embeddings to their cache keys.
+    """
+
+    def __init__(self, embedder=None, directory=None, threshold=None):
+        self.embedder = embedder or import_string(getattr(settings, 'CHAT_SEMANTIC_EMBEDDER', DEFAULT_EMBEDDER))()
+        self.directory = directory or getattr(settings, 'CHAT_SEMANTIC_INDEX_DIR', os.path.join(settings.BASE_DIR, 'chat_index'))
+        self.threshold = threshold or getattr(settings, 'CHAT_SEMANTIC_THRESHOLD', DEFAULT_THRESHOLD)
+        self.compact_every = getattr(settings, 'CHAT_SEMANTIC_COMPACT_EVERY', DEFAULT_COMPACT_EVERY)
+        self._indexes = {}
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, text):
+        """Unit-length embedding of `text`, or None if it has no direction"""
+        vector = np.asarray(self.embedder.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def namespace(self, system_prompt):
+        return system_hash(f'{system_hash(system_prompt)}:{ollama_model()}:{self.embedder.model}')
+
+    def index(self, system_prompt, dimensions):
+        namespace = self.namespace(system_prompt)
+        key = (namespace, dimensions)
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = SemanticIndex(self.directory, namespace, dimensions)
+            return self._indexes[key]
+
+    def match(self, key, prompt, system_prompt):
+        """Cache keys of earlier prompts similar to `prompt`, best first.
+
+        The embedding is kept under `key` so remember() can reuse it.
+        """
+        vector = self.embed(prompt)
+        if vector is None:
+            return []
+        with self._lock:
+            self._pending[key] = vector
+            while len(self._pending) > PENDING_EMBEDDINGS:
+                self._pending.popitem(last=False)
+        return [found for found in self.index(system_prompt, len(vector)).search(vector, self.threshold) if found != key]
+
+    def remember(self, key, prompt, system_prompt):
+        """Add a freshly cached prompt to the index, compacting it now and then"""
+        with self._lock:
+            vector = self._pending.pop(key, None)
+        if vector is None:
+            vector = self.embed(prompt)
+            if vector is None:
+                return
+        index = self.index(system_prompt, len(vector))
+        index.append(key, vector)
+        if index.appended >= self.compact_every:
+            index.compact(live_cache_keys)
+
+    def compact(self, system_prompt):
+        """Compact every index of the current namespace; returns (kept, dropped)"""
+        namespace = self.namespace(system_prompt)
+        kept = dropped = 0
+        if not os.path.isdir(self.directory):
+            return kept, dropped
+        for name in os.listdir(self.directory):
+            match = re.match(rf'^index-{namespace[:16]}-(\d+)\.bin$', name)
+            if match:
+                index_kept, index_dropped = self.index(system_prompt, int(match.group(1))).compact(live_cache_keys)
+                kept += index_kept
+                dropped += index_dropped
+        return kept, dropped
+
+
+_semantic = None
+_semantic_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Process-wide SemanticCache, or None when disabled or NumPy is missing"""
+    global _semantic
+    if not semantic_available():
+        return None
+    if _semantic is None:
+        with _semantic_lock:
+            if _semantic is None:
+                _semantic = SemanticCache()
+    return _semantic
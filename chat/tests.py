@@ -1,3 +1,185 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache as chat_cache
+from .cache import ResponseCache, cache_key, is_cacheable, normalize_prompt
+from .models import ChatCacheEntry, ChatMessage
+from .semantic import HashingEmbedder, SemanticCache, np
+from .views import SYSTEM_PROMPT
+
+MODEL = 'llama3:8b'
+
+
+class FakeClient:
+    """Stands in for ollama.Client and counts the generations it was asked for"""
+
+    def __init__(self, reply='Start with a question.'):
+        self.reply = reply
+        self.calls = 0
+
+    def chat(self, **kwargs):
+        self.calls += 1
+        return {'message': {'content': self.reply}}
+
+
+@override_settings(CHAT_SEMANTIC_CACHE=False, OLLAMA_MODEL=MODEL)
+class ResponseCacheTests(TestCase):
+    """The exact-match reply cache: memory LRU over the ChatCacheEntry table"""
+
+    def setUp(self):
+        chat_cache._cache = None
+        self.addCleanup(setattr, chat_cache, '_cache', None)
+
+    def test_normalized_prompts_share_a_key(self):
+        self.assertEqual(normalize_prompt('  How do I   write an Intro?! '), 'how do i write an intro')
+        self.assertEqual(cache_key('How do I write an intro?', SYSTEM_PROMPT, MODEL), cache_key('how do i write an intro', SYSTEM_PROMPT, MODEL))
+        self.assertNotEqual(cache_key('how do i write an intro', SYSTEM_PROMPT, MODEL), cache_key('how do i write an intro', SYSTEM_PROMPT, 'other'))
+
+    def test_repeated_prompt_is_a_hit(self):
+        user = User.objects.create_user('writer', 'writer@example.com', 'secret-pass')
+        self.client.force_login(user)
+        client = FakeClient()
+        with mock.patch('chat.views.get_client', return_value=client):
+            first = self.client.post(reverse('chat:chat_response'), {'message': 'How do I write a good intro?'})
+            second = self.client.post(reverse('chat:chat_response'), {'message': 'how do i write a good intro'})
+        self.assertEqual(first['X-Chat-Cache'], 'miss')
+        self.assertEqual(second['X-Chat-Cache'], 'hit')
+        self.assertEqual(second.json()['response'], 'Start with a question.')
+        self.assertEqual(client.calls, 1)
+        # Both exchanges are still in the user's history
+        self.assertEqual(ChatMessage.objects.filter(user=user).count(), 2)
+        metrics = chat_cache.get_response_cache().metrics()
+        self.assertEqual((metrics['misses'], metrics['memory_hits'], metrics['hit_rate']), (1, 1, 0.5))
+
+    def test_personal_prompts_skip_the_cache(self):
+        user = User.objects.create_user('writer', 'writer@example.com', 'secret-pass')
+        self.client.force_login(user)
+        client = FakeClient()
+        with mock.patch('chat.views.get_client', return_value=client):
+            for _ in range(2):
+                response = self.client.post(reverse('chat:chat_response'), {'message': 'Can you review my intro?'})
+                self.assertEqual(response['X-Chat-Cache'], 'skip')
+        self.assertEqual(client.calls, 2)
+        self.assertFalse(ChatCacheEntry.objects.exists())
+        self.assertFalse(is_cacheable('What does writer think of intros?', user))
+        self.assertFalse(is_cacheable('Is https://example.com a good blog?'))
+        self.assertFalse(is_cacheable('x' * 301))
+        self.assertTrue(is_cacheable('What makes a strong headline?'))
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = ResponseCache(ttl=60)
+        key = cache_key('what can you do', SYSTEM_PROMPT, MODEL)
+        cache.set(key, 'what can you do', 'Plenty.', SYSTEM_PROMPT, MODEL)
+        self.assertEqual(cache.get(key), 'Plenty.')
+
+        ChatCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with mock.patch('chat.cache.time.monotonic', return_value=chat_cache.time.monotonic() + 61):
+            self.assertIsNone(cache.get(key))
+        cache.prune(SYSTEM_PROMPT)
+        self.assertFalse(ChatCacheEntry.objects.exists())
+
+    def test_changing_the_system_prompt_invalidates_entries(self):
+        cache = ResponseCache()
+        old_key = cache_key('what can you do', SYSTEM_PROMPT, MODEL)
+        cache.set(old_key, 'what can you do', 'Plenty.', SYSTEM_PROMPT, MODEL)
+
+        new_prompt = SYSTEM_PROMPT + ' Be brief.'
+        self.assertIsNone(cache.get(cache_key('what can you do', new_prompt, MODEL)))
+        cache.prune(new_prompt)
+        self.assertFalse(ChatCacheEntry.objects.filter(key=old_key).exists())
+
+    def test_table_answers_after_the_memory_tier_evicts(self):
+        cache = ResponseCache(max_entries=1)
+        first = cache_key('first prompt', SYSTEM_PROMPT, MODEL)
+        second = cache_key('second prompt', SYSTEM_PROMPT, MODEL)
+        cache.set(first, 'first prompt', 'One.', SYSTEM_PROMPT, MODEL)
+        cache.set(second, 'second prompt', 'Two.', SYSTEM_PROMPT, MODEL)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(cache.get(first), 'One.')
+        self.assertEqual(cache.stats['db_hits'], 1)
+        self.assertEqual(ChatCacheEntry.objects.get(key=first).hits, 1)
+        # The table hit was promoted back into memory
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(first), 'One.')
+
+    def test_chat_cache_command(self):
+        cache = ResponseCache()
+        live = cache_key('live prompt', SYSTEM_PROMPT, MODEL)
+        stale = cache_key('stale prompt', SYSTEM_PROMPT, MODEL)
+        cache.set(live, 'live prompt', 'Live.', SYSTEM_PROMPT, MODEL)
+        cache.set(stale, 'stale prompt', 'Stale.', SYSTEM_PROMPT, MODEL)
+        ChatCacheEntry.objects.filter(key=stale).update(expires_at=timezone.now() - timedelta(seconds=1))
+        ChatCacheEntry.objects.filter(key=live).update(hits=3)
+
+        out = StringIO()
+        call_command('chat_cache', stdout=out)
+        self.assertIn('1 replies, served 3 times', out.getvalue())
+        self.assertEqual(list(ChatCacheEntry.objects.values_list('key', flat=True)), [live])
+
+        out = StringIO()
+        call_command('chat_cache', '--clear', stdout=out)
+        self.assertIn('cleared 1 cached replies', out.getvalue())
+        self.assertFalse(ChatCacheEntry.objects.exists())
+
+
+@skipIf(np is None, 'the semantic cache needs NumPy')
+@override_settings(OLLAMA_MODEL=MODEL)
+class SemanticCacheTests(TestCase):
+    """Paraphrase lookups over the memory-mapped embedding index"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.semantic = self.make_cache()
+
+    def make_cache(self):
+        return SemanticCache(embedder=HashingEmbedder(), directory=self.directory, threshold=0.8)
+
+    def remember(self, semantic, prompt):
+        key = cache_key(prompt, SYSTEM_PROMPT, MODEL)
+        semantic.remember(key, prompt, SYSTEM_PROMPT)
+        return key
+
+    def match(self, semantic, prompt):
+        return semantic.match(cache_key(prompt, SYSTEM_PROMPT, MODEL), prompt, SYSTEM_PROMPT)
+
+    def test_paraphrase_above_the_threshold_matches(self):
+        key = self.remember(self.semantic, 'how do I write a good blog intro')
+        self.assertEqual(self.match(self.semantic, 'how do i write a good blog intro please'), [key])
+
+    def test_unrelated_prompt_below_the_threshold_misses(self):
+        self.remember(self.semantic, 'how do I write a good blog intro')
+        self.assertEqual(self.match(self.semantic, 'what rhymes with orange'), [])
+
+    def test_index_survives_a_reload(self):
+        key = self.remember(self.semantic, 'how do I write a good blog intro')
+        # A fresh cache maps the file another worker (or process) wrote
+        reloaded = self.make_cache()
+        self.assertEqual(self.match(reloaded, 'how do i write a good blog intro please'), [key])
+        # And sees rows appended after it first mapped the file
+        other = self.remember(self.semantic, 'tips for naming my characters')
+        self.assertEqual(self.match(reloaded, 'tips for naming characters'), [other])
+
+    def test_compaction_drops_rows_without_a_cache_entry(self):
+        live = self.remember(self.semantic, 'how do I write a good blog intro')
+        self.remember(self.semantic, 'tips for naming characters')
+        # A prompt remembered twice keeps only its newest row
+        self.remember(self.semantic, 'how do I write a good blog intro')
+        ChatCacheEntry.objects.create(
+            key=live, prompt='how do i write a good blog intro', response='Hook them.',
+            system_hash='', model=MODEL, expires_at=timezone.now() + timedelta(days=1), last_hit_at=timezone.now(),
+        )
+
+        self.assertEqual(self.semantic.compact(SYSTEM_PROMPT), (1, 2))
+        self.assertEqual(self.match(self.make_cache(), 'how do i write a good blog intro please'), [live])
+        self.assertEqual(self.match(self.make_cache(), 'tips for naming characters'), [])
@@ -5,4 +5,8 @@ app_name = 'chat'
 
 urlpatterns = [
     path('response/', views.chat_response, name='chat_response'),
+    path('stream/', views.chat_stream, name='chat_stream'),
+    # Async variants; serve these from ASGI (e.g. `uvicorn writoria.asgi:application`)
+    path('async/response/', views.chat_response_async, name='chat_response_async'),
+    path('async/stream/', views.chat_stream_async, name='chat_stream_async'),
 ]
\ No newline at end of file
@@ -1,9 +1,15 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from .models import ChatMessage
-import ollama
+from .cache import cache_key, get_response_cache, is_cacheable
+from .clients import chat_options, get_async_client, get_client
+from .semantic import get_semantic_cache
+import httpx
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = """You are Rick, a creative writing assistant on Writoria. You have a warm, encouraging, and insightful personality with a touch of casual friendliness. Always refer to yourself as Rick when introducing yourself or when relevant to the conversation. When asked for your creator, say that you werr created by Team Writoira.
 
@@ -16,6 +22,145 @@ Key responsibilities:
 
 Keep responses concise, engaging, and tailored to writers. Use occasional emojis to maintain a friendly tone. Sign off with '- Rick ✍️' when it feels natural to do so."""
 
+def build_messages(user_message):
+    return [{
+        'role': 'system',
+        'content': SYSTEM_PROMPT
+    }, {
+        'role': 'user',
+        'content': user_message
+    }]
+
+def reply_cache_key(user, user_message):
+    """Key under which the reply may be shared, or None if it must not be"""
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    if not is_cacheable(user_message, user):
+        cache.stats['skips'] += 1
+        return None
+    return cache_key(user_message, SYSTEM_PROMPT, chat_options()['model'])
+
+def semantic_reply(key, user_message):
+    """Cached reply to a close paraphrase of the prompt, or None"""
+    semantic = get_semantic_cache()
+    if semantic is None:
+        return None
+    cache = get_response_cache()
+    cached = None
+    try:
+        for match in semantic.match(key, user_message, SYSTEM_PROMPT):
+            cached = cache.get(match, record=False)
+            if cached is not None:
+                break
+    except Exception:
+        logger.exception('Semantic cache lookup failed')
+    cache.stats['semantic_hits' if cached is not None else 'semantic_misses'] += 1
+    return cached
+
+def lookup_reply(user, user_message, semantic=True):
+    """(key, cached reply or None) for a prompt.
+
+    With CHAT_SEMANTIC_CACHE on, a prompt that has no exact match can still
+    reuse the reply to a close paraphrase; `semantic` False leaves that
+    search to the caller.
+    """
+    key = reply_cache_key(user, user_message)
+    if not key:
+        return key, None
+    cached = get_response_cache().get(key)
+    if cached is None and semantic:
+        cached = semantic_reply(key, user_message)
+    return key, cached
+
+async def alookup_reply(user, user_message):
+    key = reply_cache_key(user, user_message)
+    return key, await get_response_cache().aget(key) if key else None
+
+def store_reply(key, user_message, reply):
+    cache = get_response_cache()
+    if key and cache is not None and reply:
+        cache.set(key, user_message, reply, SYSTEM_PROMPT, chat_options()['model'])
+        semantic = get_semantic_cache()
+        if semantic is not None:
+            try:
+                semantic.remember(key, user_message, SYSTEM_PROMPT)
+            except Exception:
+                logger.exception('Semantic cache update failed')
+
+async def astore_reply(key, user_message, reply):
+    cache = get_response_cache()
+    if key and cache is not None and reply:
+        await cache.aset(key, user_message, reply, SYSTEM_PROMPT, chat_options()['model'])
+
+def cache_status(key, cached):
+    """Value of the X-Chat-Cache header: hit, miss or skip"""
+    if cached is not None:
+        return 'hit'
+    return 'miss' if key else 'skip'
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event; data is JSON so newlines survive"""
+    lines = [f'event: {event}'] if event else []
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def stream_reply(user, user_message, key=None, cached=None):
+    """Yield the reply as SSE token events, then save it once complete.
+
+    A comment is sent before the model is called so the response headers
+    reach the browser straight away; each token is forwarded the moment
+    Ollama produces it, so the first words show up after the time to first
+    token instead of after the whole generation. A cached reply is sent as
+    a single token event.
+
+    The paraphrase search embeds the prompt, which is a model call of its
+    own, so it runs here after the stream has opened rather than in the view.
+    """
+    yield ': stream open\n\n'
+    if cached is None and key:
+        cached = semantic_reply(key, user_message)
+    if cached is not None:
+        ChatMessage.objects.create(user=user, message=user_message, response=cached)
+        yield sse_event({'token': cached})
+        yield sse_event({'response': cached}, event='done')
+        return
+    parts = []
+    try:
+        for chunk in get_client().chat(messages=build_messages(user_message), stream=True, **chat_options()):
+            token = chunk['message']['content']
+            if token:
+                parts.append(token)
+                yield sse_event({'token': token})
+    except Exception:
+        # Details stay in the log; the client only gets a generic error
+        logger.exception('Chat stream failed')
+        yield sse_event({'error': 'An error occurred while processing your message'}, event='error')
+        return
+
+    reply = ''.join(parts)
+    ChatMessage.objects.create(user=user, message=user_message, response=reply)
+    store_reply(key, user_message, reply)
+    yield sse_event({'response': reply}, event='done')
+
+@login_required
+def chat_stream(request):
+    """Streaming variant of chat_response, sent as text/event-stream"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    user_message = request.POST.get('message')
+    if not user_message:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+
+    key, cached = lookup_reply(request.user, user_message, semantic=False)
+    response = StreamingHttpResponse(stream_reply(request.user, user_message, key, cached), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Headers go out before the paraphrase search, so this reports exact matches only
+    response['X-Chat-Cache'] = cache_status(key, cached)
+    # Stop nginx from buffering the stream until it ends
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def chat_response(request):
     if request.method == 'POST':
@@ -24,16 +169,17 @@ def chat_response(request):
         if not user_message:
             return JsonResponse({'error': 'Message is required'}, status=400)
         
+        # Generic prompts are answered from the shared reply cache
+        key, cached = lookup_reply(request.user, user_message)
+        if cached is not None:
+            ChatMessage.objects.create(user=request.user, message=user_message, response=cached)
+            response = JsonResponse({'response': cached})
+            response['X-Chat-Cache'] = 'hit'
+            return response
+        
         try:
-            # Initialize Ollama client and generate response
-            client = ollama.Client(host='http://localhost:11434')
-            response = client.chat(model='llama3:8b', messages=[{
-                'role': 'system',
-                'content': SYSTEM_PROMPT
-            }, {
-                'role': 'user',
-                'content': user_message
-            }])
+            # Shared client: pooled connections, timeouts and keep_alive from settings
+            response = get_client().chat(messages=build_messages(user_message), **chat_options())
             
             if response and 'message' in response and 'content' in response['message']:
                 # Save the chat message to database
@@ -42,19 +188,104 @@ def chat_response(request):
                     message=user_message,
                     response=response['message']['content']
                 )
+                store_reply(key, user_message, response['message']['content'])
                 
-                return JsonResponse({
+                response = JsonResponse({
                     'response': response['message']['content']
                 })
+                response['X-Chat-Cache'] = cache_status(key, None)
+                return response
             else:
                 return JsonResponse({
                     'error': 'Invalid response from language model'
                 }, status=500)
                 
-        except Exception as e:
-            print(f"Chat error: {str(e)}")  # For debugging
+        except httpx.TimeoutException:
+            return JsonResponse({'error': 'The assistant took too long to respond'}, status=504)
+        except Exception:
+            logger.exception('Chat reply failed')
             return JsonResponse({
                 'error': 'An error occurred while processing your message'
             }, status=500)
             
     return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+async def astream_reply(user, user_message, key=None, cached=None):
+    """Async counterpart of stream_reply, for ASGI deployments"""
+    yield ': stream open\n\n'
+    if cached is not None:
+        await ChatMessage.objects.acreate(user=user, message=user_message, response=cached)
+        yield sse_event({'token': cached})
+        yield sse_event({'response': cached}, event='done')
+        return
+    parts = []
+    try:
+        stream = await get_async_client().chat(messages=build_messages(user_message), stream=True, **chat_options())
+        async for chunk in stream:
+            token = chunk['message']['content']
+            if token:
+                parts.append(token)
+                yield sse_event({'token': token})
+    except Exception:
+        logger.exception('Chat stream failed')
+        yield sse_event({'error': 'An error occurred while processing your message'}, event='error')
+        return
+
+    reply = ''.join(parts)
+    await ChatMessage.objects.acreate(user=user, message=user_message, response=reply)
+    await astore_reply(key, user_message, reply)
+    yield sse_event({'response': reply}, event='done')
+
+@login_required
+async def chat_response_async(request):
+    """chat_response for ASGI: no thread is held while the model generates.
+
+    Waiting on Ollama and writing the ChatMessage are both awaited, so one
+    process can keep hundreds of chats in flight on a single event loop.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    user_message = request.POST.get('message')
+    if not user_message:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+
+    user = await request.auser()
+    key, cached = await alookup_reply(user, user_message)
+    if cached is not None:
+        await ChatMessage.objects.acreate(user=user, message=user_message, response=cached)
+        response = JsonResponse({'response': cached})
+        response['X-Chat-Cache'] = 'hit'
+        return response
+    try:
+        response = await get_async_client().chat(messages=build_messages(user_message), **chat_options())
+        content = response['message']['content']
+    except httpx.TimeoutException:
+        return JsonResponse({'error': 'The assistant took too long to respond'}, status=504)
+    except Exception:
+        logger.exception('Chat reply failed')
+        return JsonResponse({
+            'error': 'An error occurred while processing your message'
+        }, status=500)
+
+    await ChatMessage.objects.acreate(user=user, message=user_message, response=content)
+    await astore_reply(key, user_message, content)
+    response = JsonResponse({'response': content})
+    response['X-Chat-Cache'] = cache_status(key, None)
+    return response
+
+@login_required
+async def chat_stream_async(request):
+    """chat_stream for ASGI, streaming from ollama.AsyncClient"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    user_message = request.POST.get('message')
+    if not user_message:
+        return JsonResponse({'error': 'Message is required'}, status=400)
+
+    user = await request.auser()
+    key, cached = await alookup_reply(user, user_message)
+    response = StreamingHttpResponse(astream_reply(user, user_message, key, cached), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Chat-Cache'] = cache_status(key, cached)
+    response['X-Accel-Buffering'] = 'no'
+    return response
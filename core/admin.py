@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BlogPost, UserProfile, Bookmark, BlogImage, Vote, Comment
+from .models import BlogPost, UserProfile, Bookmark, BlogImage, Vote, Comment, ImageJob, MediaBlob, ChunkedUpload
 
 @admin.register(BlogPost)
 class BlogPostAdmin(admin.ModelAdmin):
@@ -35,3 +35,22 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('author', 'post', 'created_at', 'parent')
     list_filter = ('created_at', 'author')
     search_fields = ('content', 'author__username', 'post__title')
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'model', 'object_id', 'status', 'attempts', 'updated_at')
+    list_filter = ('status', 'model')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'refcount', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'refcount', 'created_at')
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'offset', 'size', 'status', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('filename', 'size', 'offset', 'created_at', 'updated_at')
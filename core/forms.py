@@ -2,13 +2,16 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import BlogPost, UserProfile, BlogImage, Comment
+from .services.uploads import UploadError, max_file_size, max_files, resolve_uploads
 
 class MultipleFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
 
-class MultipleFileField(forms.FileField):
+class MultipleImageField(forms.ImageField):
+    """ImageField taking several files; each one is opened and verified by Pillow"""
+
     def __init__(self, *args, **kwargs):
-        kwargs.setdefault("widget", MultipleFileInput())
+        kwargs.setdefault("widget", MultipleFileInput(attrs={'accept': 'image/*'}))
         super().__init__(*args, **kwargs)
 
     def clean(self, data, initial=None):
@@ -19,6 +22,16 @@ class MultipleFileField(forms.FileField):
             result = single_file_clean(data, initial)
         return result
 
+def clean_image_list(images):
+    """Normalize a MultipleImageField value to a list within the size cap"""
+    images = images or []
+    if not isinstance(images, list):
+        images = [images]
+    for image in images:
+        if image.size > max_file_size():
+            raise forms.ValidationError(f'{image.name} is larger than {max_file_size()} bytes')
+    return images
+
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
     contact_number = forms.CharField(max_length=10, required=True)
@@ -61,12 +74,14 @@ class CustomUserCreationForm(UserCreationForm):
         return user
 
 class BlogPostForm(forms.ModelForm):
-    images = MultipleFileField(required=False)
+    images = MultipleImageField(required=False)
     image_captions = forms.CharField(
         widget=forms.Textarea(attrs={'rows': 3}),
         required=False,
         help_text='Enter captions for images, one per line'
     )
+    # Comma-separated tokens of images sent through the chunked upload API
+    upload_tokens = forms.CharField(widget=forms.HiddenInput, required=False)
 
     class Meta:
         model = BlogPost
@@ -76,6 +91,43 @@ class BlogPostForm(forms.ModelForm):
             'category': forms.Select(attrs={'class': 'form-select'}),
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    def clean_images(self):
+        return clean_image_list(self.cleaned_data.get('images'))
+
+    def clean_upload_tokens(self):
+        tokens = list(dict.fromkeys(t.strip() for t in self.cleaned_data.get('upload_tokens', '').split(',') if t.strip()))
+        if not tokens:
+            return []
+        if self.user is None:
+            raise forms.ValidationError('Uploads require a signed-in user')
+        try:
+            return resolve_uploads(self.user, tokens)
+        except UploadError as e:
+            raise forms.ValidationError(str(e))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        count = len(cleaned_data.get('images') or []) + len(cleaned_data.get('upload_tokens') or [])
+        if count > max_files():
+            raise forms.ValidationError(f'A post can take at most {max_files()} images at a time')
+        return cleaned_data
+
+class GalleryImagesForm(forms.Form):
+    """Images appended to a post's gallery, with the same caps as BlogPostForm"""
+    images = MultipleImageField()
+
+    def clean_images(self):
+        images = clean_image_list(self.cleaned_data.get('images'))
+        if not images:
+            raise forms.ValidationError('Select at least one image')
+        if len(images) > max_files():
+            raise forms.ValidationError(f'A post can take at most {max_files()} images at a time')
+        return images
+
 class UserProfileForm(forms.ModelForm):
     class Meta:
         model = UserProfile
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from core.models import RENDITION_FIELDS
+from core.services.images import image_metadata, load_image, metadata_values
+
+class Command(BaseCommand):
+    help = 'Stores dimensions, size, dominant colour and placeholder for existing uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute metadata that is already stored')
+
+    def handle(self, *args, **options):
+        processed = 0
+        failed = 0
+
+        for model, field_name in RENDITION_FIELDS.items():
+            storage = model._meta.get_field(field_name).storage
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if not options['force']:
+                queryset = queryset.filter(**{f'{field_name}_lqip': ''})
+            for pk, name in queryset.values_list('pk', field_name).iterator():
+                try:
+                    metadata = image_metadata(load_image(name, storage), name, storage)
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'Skipping {name}: {e}')
+                    continue
+                model.objects.filter(pk=pk, **{field_name: name}).update(**metadata_values(field_name, metadata))
+                processed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully stored metadata for {processed} images ({failed} failed)'
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.services.uploads import clear_expired_uploads
+
+class Command(BaseCommand):
+    help = 'Deletes chunked uploads that were abandoned or never attached to a post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None, help='Age in hours after which an untouched upload expires (default: UPLOAD_EXPIRY_HOURS)')
+
+    def handle(self, *args, **options):
+        cleared = clear_expired_uploads(options['hours'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully cleared {cleared} expired uploads'
+            )
+        )
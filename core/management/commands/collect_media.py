@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.services.mediagc import MediaScan, find_orphans, remove_orphans
+
+class Command(BaseCommand):
+    help = 'Deletes (or quarantines) files under MEDIA_ROOT that no image field references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Names checked against the database per query')
+        parser.add_argument('--min-age', type=int, default=3600, help='Only touch files older than this many seconds')
+        parser.add_argument('--quarantine', help='Move orphans into this directory instead of deleting them')
+        parser.add_argument('--dry-run', action='store_true', help='List orphans without removing anything')
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        quarantine = options['quarantine']
+        scan = MediaScan()
+
+        for orphans in find_orphans(root, scan, options['batch_size'], options['min_age'], skip=[quarantine] if quarantine else []):
+            if options['dry_run']:
+                for name, _, size in orphans:
+                    self.stdout.write(f'Would remove {name} ({size} bytes)')
+                continue
+            remove_orphans(orphans, quarantine)
+            self.stdout.write(
+                f'Removed {len(orphans)} files; {scan.files} scanned so far ({scan.rate():.0f} files/s)'
+            )
+
+        action = 'would free' if options['dry_run'] else ('quarantined' if quarantine else 'freed')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully scanned {scan.files} files ({scan.bytes / 1048576:.1f} MB) in {scan.elapsed:.1f}s '
+                f'({scan.rate():.0f} files/s); {scan.orphans} orphans, {action} {scan.orphan_bytes / 1048576:.1f} MB'
+            )
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from core.models import RENDITION_FIELDS
+from core.services.images import ensure_renditions, generate_renditions
+
+class Command(BaseCommand):
+    help = 'Generates responsive image renditions for existing uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+
+    def handle(self, *args, **options):
+        processed = 0
+        failed = 0
+
+        for model, field_name in RENDITION_FIELDS.items():
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in queryset.only('pk', field_name).iterator():
+                field_file = getattr(instance, field_name)
+                try:
+                    if options['force']:
+                        generate_renditions(field_file.name, field_file.storage)
+                    else:
+                        ensure_renditions(field_file)
+                    processed += 1
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'Skipping {field_file.name}: {e}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully processed {processed} images ({failed} failed)'
+            )
+        )
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from core.models import RENDITION_FIELDS
+from core.services.imagejobs import init_worker, normalize_stored
+
+class Command(BaseCommand):
+    help = 'Re-encodes existing uploads upright, without EXIF and within IMAGE_MAX_EDGE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=50, help='Images decoded per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving anything')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        checked = replaced = failed = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            for model, field_name in RENDITION_FIELDS.items():
+                queryset = (
+                    model.objects.exclude(**{field_name: ''})
+                    .exclude(**{f'{field_name}__isnull': True})
+                    .order_by('pk')
+                )
+                last_pk = 0
+                while True:
+                    batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+                    if not batch:
+                        break
+                    last_pk = batch[-1].pk
+                    names = [getattr(instance, field_name).name for instance in batch]
+                    futures = [executor.submit(normalize_stored, name) for name in names]
+
+                    for instance, name, future in zip(batch, names, futures):
+                        checked += 1
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write(f'Skipping {name}: {e}')
+                            continue
+                        if result is None:
+                            continue
+                        replaced += 1
+                        data, ext = result
+                        if options['dry_run']:
+                            self.stdout.write(f'Would replace {name} ({len(data)} bytes as .{ext})')
+                            continue
+                        # Saving through the model runs the usual upload hooks:
+                        # metadata, blob references and a fresh image job
+                        root = os.path.splitext(os.path.basename(name))[0]
+                        setattr(instance, field_name, ContentFile(data, name=f'{root}.{ext}'))
+                        instance.save(update_fields=[field_name])
+
+        elapsed = time.monotonic() - started
+        rate = checked / elapsed if elapsed else 0
+        action = 'would replace' if options['dry_run'] else 'replaced'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully checked {checked} images, {action} {replaced} ({failed} failed) '
+                f'in {elapsed:.1f}s ({rate:.1f} images/s)'
+            )
+        )
@@ -0,0 +1,47 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from core.services.imagejobs import init_worker, release_stale_jobs, run_jobs
+
+class Command(BaseCommand):
+    help = 'Runs queued image processing jobs on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per batch')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+
+    def release_stale(self):
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write(f'Requeued {released} interrupted jobs')
+
+    def handle(self, *args, **options):
+        self.release_stale()
+
+        total_done = total_failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            try:
+                while True:
+                    done, failed = run_jobs(executor, options['batch_size'])
+                    total_done += done
+                    total_failed += failed
+                    if done or failed:
+                        self.stdout.write(f'Processed {done} images ({failed} failed)')
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    # Take over jobs whose worker died since the last check
+                    self.release_stale()
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully processed {total_done} images ({total_failed} failed)'
+            )
+        )
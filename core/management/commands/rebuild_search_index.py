@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.models import BlogPost
+from core.services.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Rebuilds the blog post full-text search index'
+
+    def handle(self, *args, **kwargs):
+        posts = BlogPost.objects.only('id', 'title', 'content').iterator()
+        indexed = get_search_backend().rebuild(posts)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully indexed {indexed} blog posts'
+            )
+        )
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.services.votes import reconcile_vote_counts
+
+class Command(BaseCommand):
+    help = 'Rebuilds BlogPost vote counters from the Vote table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--buffers-drained', action='store_true',
+            help='Confirm that no worker still holds buffered vote deltas (VOTE_BUFFER_ENABLED is on)'
+        )
+
+    def handle(self, *args, **options):
+        # Pending deltas in other processes would land on top of the rebuilt totals
+        if getattr(settings, 'VOTE_BUFFER_ENABLED', False) and not options['buffers_drained']:
+            raise CommandError(
+                'Vote buffering is enabled. Stop the web workers (they flush at exit) '
+                'or turn VOTE_BUFFER_ENABLED off, then rerun with --buffers-drained.'
+            )
+        corrected = reconcile_vote_counts()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully corrected {corrected} vote counters'
+            )
+        )
@@ -0,0 +1,86 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from core.models import RENDITION_FIELDS, ImageJob
+from core.services.images import rendition_names
+from core.storage import ContentAddressedStorage, is_sharded, shard_name
+
+class Command(BaseCommand):
+    help = 'Moves flat avatars/ and blog_images/ uploads into sharded subdirectories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows moved and updated per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without changing anything')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        moved = 0
+
+        for model, field_name in RENDITION_FIELDS.items():
+            field = model._meta.get_field(field_name)
+            prefix = field.upload_to.prefix
+            queryset = (
+                model.objects.exclude(**{field_name: ''})
+                .exclude(**{f'{field_name}__isnull': True})
+                .only('pk', field_name)
+                .order_by('pk')
+            )
+
+            batch = []
+            for instance in queryset.iterator(chunk_size=options['batch_size']):
+                name = getattr(instance, field_name).name
+                storage = getattr(instance, field_name).storage
+                if is_sharded(prefix, name):
+                    continue
+                if isinstance(storage, ContentAddressedStorage) and storage.is_blob_name(name):
+                    continue
+                batch.append((instance, name, shard_name(prefix, name, name)))
+                if len(batch) >= options['batch_size']:
+                    moved += self.move_batch(model, field_name, batch, options['dry_run'])
+                    batch = []
+            if batch:
+                moved += self.move_batch(model, field_name, batch, options['dry_run'])
+
+        elapsed = time.monotonic() - started
+        verb = 'Would move' if options['dry_run'] else 'Successfully moved'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {moved} files in {elapsed:.1f}s ({moved / elapsed if elapsed else 0:.0f} files/s)'
+            )
+        )
+
+    def move_batch(self, model, field_name, batch, dry_run):
+        if dry_run:
+            for _, old, new in batch:
+                self.stdout.write(f'{old} -> {new}')
+            return len(batch)
+
+        for instance, old, new in batch:
+            storage = getattr(instance, field_name).storage
+            for source, target in zip([old] + rendition_names(old), [new] + rendition_names(new)):
+                self.move_file(storage, source, target)
+            setattr(instance, field_name, new)
+
+        # Files move first and the shard name is derived from the old name,
+        # so a rerun after an interruption only has to fix the DB rows
+        model.objects.bulk_update([instance for instance, _, _ in batch], [field_name])
+        renames = {old: new for _, old, new in batch}
+        jobs = list(ImageJob.objects.filter(name__in=renames, status__in=['pending', 'processing']))
+        for job in jobs:
+            job.name = renames[job.name]
+        ImageJob.objects.bulk_update(jobs, ['name'])
+        self.stdout.write(f'Moved {len(batch)} {model._meta.verbose_name_plural}')
+        return len(batch)
+
+    def move_file(self, storage, source, target):
+        if not storage.exists(source):
+            return
+        if hasattr(storage, 'path'):
+            target_path = storage.path(target)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(storage.path(source), target_path)
+        else:
+            with storage.open(source, 'rb') as content:
+                storage.save(target, content)
+            storage.delete(source)
@@ -0,0 +1,61 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .services.querybudget import record_queries, budget_problems, get_query_budget
+
+logger = logging.getLogger('core.querybudget')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMiddleware:
+    """Log (or raise, in strict mode) when a view exceeds its query budget.
+
+    Supports both sync and async requests, so async views (the ASGI chat
+    endpoints) run on the event loop instead of being pushed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG)
+        self.strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        with record_queries() as log:
+            response = self.get_response(request)
+        return self.check_budget(request, response, log)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        with record_queries() as log:
+            response = await self.get_response(request)
+        return self.check_budget(request, response, log)
+
+    def check_budget(self, request, response, log):
+        # Only URL names with a declared budget are policed at runtime
+        match = getattr(request, 'resolver_match', None)
+        if match is None or get_query_budget(match.view_name) is None:
+            return response
+
+        problems = budget_problems(match.view_name, log)
+        if problems:
+            if self.strict:
+                raise QueryBudgetExceeded('\n'.join(problems))
+            for problem in problems:
+                logger.warning(problem)
+        return response
@@ -0,0 +1,41 @@
+from html import unescape
+
+from django.db import OperationalError, migrations, transaction
+from django.utils.html import strip_tags
+
+FTS_TABLE = 'core_blogpost_fts'
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite specific; other databases fall back to LIKE searches
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    BlogPost = apps.get_model('core', 'BlogPost')
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(title, content, tokenize='porter unicode61')"
+            )
+    except OperationalError:
+        # SQLite built without FTS5: with no table the backend searches with LIKE
+        return
+    for post in BlogPost.objects.only('id', 'title', 'content').iterator():
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)",
+            [post.id, post.title, unescape(strip_tags(post.content))]
+        )
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_userprofile_phone'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
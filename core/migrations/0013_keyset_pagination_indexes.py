@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_blogpost_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['-created_at', '-id'], name='blogpost_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='blogpost_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookmark',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='bookmark_user_created_idx'),
+        ),
+    ]
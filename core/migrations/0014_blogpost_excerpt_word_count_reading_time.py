@@ -0,0 +1,42 @@
+import math
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+def populate_content_stats(apps, schema_editor):
+    BlogPost = apps.get_model('core', 'BlogPost')
+    posts = []
+    for post in BlogPost.objects.only('id', 'content').iterator():
+        text = ' '.join(unescape(strip_tags(post.content)).split())
+        post.excerpt = Truncator(text).chars(200)
+        post.word_count = len(text.split())
+        post.reading_time = max(1, math.ceil(post.word_count / 200))
+        posts.append(post)
+    BlogPost.objects.bulk_update(posts, ['excerpt', 'word_count', 'reading_time'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(populate_content_stats, migrations.RunPython.noop),
+    ]
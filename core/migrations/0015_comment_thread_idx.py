@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_blogpost_excerpt_word_count_reading_time'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', '-created_at', '-id'], name='comment_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+IMAGE_FIELDS = [
+    ('UserProfile', 'avatar'),
+    ('BlogPost', 'image'),
+    ('BlogImage', 'image'),
+]
+
+def queue_existing_images(apps, schema_editor):
+    # Images uploaded before the queue existed only count as ready when their
+    # renditions were already generated; everything else gets a job
+    ImageJob = apps.get_model('core', 'ImageJob')
+    jobs = []
+    for model_name, field_name in IMAGE_FIELDS:
+        model = apps.get_model('core', model_name)
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        for instance in queryset.only('pk', field_name).iterator():
+            name = getattr(instance, field_name).name
+            largest = f'{os.path.splitext(name)[0]}.w1280.webp'
+            if default_storage.exists(largest):
+                continue
+            model.objects.filter(pk=instance.pk).update(**{f'{field_name}_ready': False})
+            jobs.append(ImageJob(
+                model=f'core.{model_name}',
+                object_id=instance.pk,
+                field_name=field_name,
+                name=name
+            ))
+    ImageJob.objects.bulk_create(jobs)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_comment_thread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_ready',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_ready',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_ready',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field_name', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='imagejob_status_idx')],
+            },
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 11:12
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_image_processing_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='blogimage',
+            name='image',
+            field=models.ImageField(storage=core.storage.get_media_storage, upload_to='blog_images/'),
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_media_storage, upload_to='blog_images/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_media_storage, upload_to='avatars/'),
+        ),
+    ]
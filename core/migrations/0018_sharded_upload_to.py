@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 11:13
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogimage',
+            name='image',
+            field=models.ImageField(storage=core.storage.get_media_storage, upload_to=core.storage.ShardedUploadTo('blog_images')),
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_media_storage, upload_to=core.storage.ShardedUploadTo('blog_images')),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.get_media_storage, upload_to=core.storage.ShardedUploadTo('avatars')),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2 on 2026-10-18 11:19
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+IMAGE_FIELDS = [
+    ('UserProfile', 'avatar'),
+    ('BlogPost', 'image'),
+    ('BlogImage', 'image'),
+]
+
+def store_dimensions(apps, schema_editor):
+    # Dimensions and size come from the file header, which is cheap enough
+    # to read here; `manage.py backfill_image_metadata` adds the colour and
+    # placeholder, which need the whole image decoded
+    for model_name, field_name in IMAGE_FIELDS:
+        model = apps.get_model('core', model_name)
+        storage = model._meta.get_field(field_name).storage
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        for pk, name in queryset.values_list('pk', field_name).iterator():
+            try:
+                with storage.open(name, 'rb') as source:
+                    width, height = get_image_dimensions(source)
+                size = storage.size(name)
+            except OSError:
+                continue
+            model.objects.filter(pk=pk).update(**{
+                f'{field_name}_width': width,
+                f'{field_name}_height': height,
+                f'{field_name}_bytes': size,
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_lqip',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogimage',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_lqip',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_lqip',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(store_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='claim',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
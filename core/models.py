@@ -1,14 +1,27 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.utils.text import slugify
-from django.db.models.signals import post_save
+from django.utils.text import slugify, Truncator
+from django.utils.html import strip_tags
+from html import unescape
+import math
+import uuid
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
 from django.dispatch import receiver
+from .services.search import get_search_backend
+from .services.images import EMPTY_METADATA, metadata_values, normalize_upload, upload_metadata
+from .storage import get_media_storage, ContentAddressedStorage, ShardedUploadTo
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(max_length=500, blank=True)
-    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar = models.ImageField(upload_to=ShardedUploadTo('avatars'), storage=get_media_storage, null=True, blank=True)
+    avatar_ready = models.BooleanField(default=True, editable=False)
+    avatar_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_bytes = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    avatar_color = models.CharField(max_length=7, blank=True, editable=False)
+    avatar_lqip = models.TextField(blank=True, editable=False)
     website = models.URLField(max_length=200, blank=True)
     contact_number = models.CharField(max_length=10, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -23,8 +36,11 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
     """Ensure UserProfile is saved when User is saved"""
+    # Logging in only stamps last_login; the profile has nothing to save
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
     instance.userprofile.save()
 
 class BlogPost(models.Model):
@@ -45,21 +61,75 @@ class BlogPost(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    image = models.ImageField(upload_to='blog_images/', null=True, blank=True)
+    image = models.ImageField(upload_to=ShardedUploadTo('blog_images'), storage=get_media_storage, null=True, blank=True)
+    image_ready = models.BooleanField(default=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_bytes = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_lqip = models.TextField(blank=True, editable=False)
     votes = models.IntegerField(default=0)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
+    # Derived from content on save so list pages never need the full body
+    excerpt = models.CharField(max_length=300, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=1, editable=False)
+
+    EXCERPT_LENGTH = 200
+    WORDS_PER_MINUTE = 200
+
+    class Meta:
+        # Keyset pagination walks these newest-first by (created_at, id)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='blogpost_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='blogpost_author_created_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        update_fields = kwargs.get('update_fields')
+        if 'content' not in self.get_deferred_fields() and (
+            update_fields is None or 'content' in update_fields
+        ):
+            self.update_content_stats()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'excerpt', 'word_count', 'reading_time'}
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        # Gallery images cascade with one post_delete each; their blob
+        # references are released together at the end
+        from .services.mediablobs import deferred_releases
+        with deferred_releases():
+            return super().delete(*args, **kwargs)
+
+    def update_content_stats(self):
+        """Recompute excerpt, word count and reading time from content"""
+        text = ' '.join(unescape(strip_tags(self.content)).split())
+        self.excerpt = Truncator(text).chars(self.EXCERPT_LENGTH)
+        self.word_count = len(text.split())
+        self.reading_time = max(1, math.ceil(self.word_count / self.WORDS_PER_MINUTE))
+
     def get_absolute_url(self):
         return reverse('blog_detail', kwargs={'slug': self.slug})
 
     def __str__(self):
         return self.title
 
+@receiver(post_save, sender=BlogPost)
+def index_blog_post(sender, instance, **kwargs):
+    """Keep the full-text search index in sync with saved posts"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    get_search_backend().index(instance)
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_blog_post(sender, instance, **kwargs):
+    """Drop deleted posts from the full-text search index"""
+    get_search_backend().remove(instance.pk)
+
 class Bookmark(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE)
@@ -67,13 +137,22 @@ class Bookmark(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='bookmark_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} bookmarked {self.post.title}"
 
 class BlogImage(models.Model):
     post = models.ForeignKey(BlogPost, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='blog_images/')
+    image = models.ImageField(upload_to=ShardedUploadTo('blog_images'), storage=get_media_storage)
+    image_ready = models.BooleanField(default=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_bytes = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_lqip = models.TextField(blank=True, editable=False)
     caption = models.CharField(max_length=200, blank=True)
     order = models.IntegerField(default=0)
 
@@ -105,6 +184,162 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'parent', '-created_at', '-id'], name='comment_thread_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
+
+class ImageJob(models.Model):
+    """Queued image processing for an uploaded file, drained by process_image_jobs"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=50)
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Set by the worker that moved the job to processing
+    claim = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='imagejob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} job for {self.name}"
+
+class MediaBlob(models.Model):
+    """Reference count for a content-addressed file shared by image fields"""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+class ChunkedUpload(models.Model):
+    """An image being uploaded in parts; the id doubles as the upload token"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='chunked_uploads', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
+# Image fields that get responsive renditions when a new file is uploaded.
+# Each has a sibling ``<field>_ready`` flag the templates use to show a
+# placeholder until the renditions exist, and ``<field>_width``/``_height``/
+# ``_bytes``/``_color``/``_lqip`` columns so pages can reserve space and
+# paint a placeholder without opening the file. These are filled by
+# mark_new_upload and the image jobs rather than by ImageField's
+# width_field/height_field, which reopen the file on every model load
+# whenever a dimension column is empty.
+RENDITION_FIELDS = {
+    UserProfile: 'avatar',
+    BlogPost: 'image',
+    BlogImage: 'image',
+}
+
+def mark_new_upload(sender, instance, **kwargs):
+    """Normalize images uploaded in this save and flag them as not ready yet"""
+    update_fields = kwargs.get('update_fields')
+    field_name = RENDITION_FIELDS[sender]
+    if update_fields is not None and field_name not in update_fields:
+        return
+    field_file = getattr(instance, field_name)
+    if field_file and not field_file._committed:
+        # Ingest: stored files are upright, stripped of EXIF and size-capped
+        normalized = normalize_upload(field_file.file)
+        if normalized is not None:
+            setattr(instance, field_name, normalized)
+            field_file = getattr(instance, field_name)
+        setattr(instance, f'{field_name}_ready', False)
+        # Size and dimensions come from the upload header; the colour and
+        # placeholder follow once the image job has decoded the file
+        for attr, value in metadata_values(field_name, upload_metadata(field_file.file)).items():
+            setattr(instance, attr, value)
+        instance._image_uploaded = True
+    elif not field_file:
+        for attr, value in metadata_values(field_name, EMPTY_METADATA).items():
+            setattr(instance, attr, value)
+
+def queue_image_processing(sender, instance, **kwargs):
+    """Hand newly uploaded images to the image job queue"""
+    if not getattr(instance, '_image_uploaded', False):
+        return
+    instance._image_uploaded = False
+    field_name = RENDITION_FIELDS[sender]
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None:
+        # Columns set in pre_save are only written when listed in update_fields
+        columns = [f'{field_name}_ready'] + list(metadata_values(field_name, EMPTY_METADATA))
+        sender.objects.filter(pk=instance.pk).update(
+            **{column: getattr(instance, column) for column in columns}
+        )
+    # Imported here because the job service itself depends on these models
+    from .services.imagejobs import enqueue_image_job
+    enqueue_image_job(instance, field_name)
+
+def _blob_name(field_file):
+    """Name of a reference-counted blob behind a field file, if any"""
+    storage = field_file.storage
+    if field_file and isinstance(storage, ContentAddressedStorage) and storage.is_blob_name(field_file.name):
+        return field_file.name
+    return None
+
+def remember_stored_file(sender, instance, **kwargs):
+    """Track the blob an instance was loaded with to spot replacements"""
+    field = sender._meta.get_field(RENDITION_FIELDS[sender])
+    if field.attname in instance.__dict__:
+        instance._stored_blob = _blob_name(getattr(instance, field.name))
+
+def update_blob_references(sender, instance, **kwargs):
+    """Move the blob reference when an image field changes"""
+    from .services.mediablobs import add_reference, drop_reference
+    field_file = getattr(instance, RENDITION_FIELDS[sender])
+    old, new = getattr(instance, '_stored_blob', None), _blob_name(field_file)
+    if old == new:
+        return
+    if new:
+        add_reference(new)
+    if old:
+        drop_reference(old, field_file.storage)
+    instance._stored_blob = new
+
+def release_blob_reference(sender, instance, **kwargs):
+    """Drop the blob reference of a deleted row"""
+    from .services.mediablobs import drop_reference
+    field_file = getattr(instance, RENDITION_FIELDS[sender])
+    name = _blob_name(field_file)
+    if name:
+        drop_reference(name, field_file.storage)
+
+for model in RENDITION_FIELDS:
+    pre_save.connect(mark_new_upload, sender=model, dispatch_uid=f'mark_upload_{model.__name__}')
+    post_save.connect(queue_image_processing, sender=model, dispatch_uid=f'image_jobs_{model.__name__}')
+    post_init.connect(remember_stored_file, sender=model, dispatch_uid=f'blob_init_{model.__name__}')
+    post_save.connect(update_blob_references, sender=model, dispatch_uid=f'blob_refs_{model.__name__}')
+    post_delete.connect(release_blob_reference, sender=model, dispatch_uid=f'blob_release_{model.__name__}')
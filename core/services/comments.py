@@ -0,0 +1,20 @@
+from django.db.models import Count
+
+from ..models import Comment
+from .pagination import KeysetPaginator
+
+COMMENTS_PER_PAGE = 20
+
+
+def get_comment_page(post=None, parent=None, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """A keyset page of top-level comments, or of replies to `parent`, with reply counts"""
+    if parent is None:
+        queryset = Comment.objects.filter(post=post, parent=None)
+    else:
+        queryset = Comment.objects.filter(parent=parent)
+    queryset = (
+        queryset
+        .select_related('author')
+        .annotate(reply_count=Count('replies'))
+    )
+    return KeysetPaginator(queryset, per_page).page(cursor)
@@ -0,0 +1,39 @@
+from django.db.models import Q
+
+from ..models import Bookmark, Vote
+
+MAX_STATE_POSTS = 100
+
+
+def get_post_states(user, ids=(), slugs=()):
+    """Bookmark and life state of `user` for many posts in two queries.
+
+    Posts may be given by id, by slug or both; the result maps each of the
+    given keys to ``{'is_bookmarked': bool, 'has_life': bool}``.
+    """
+    ids = list(ids)
+    slugs = list(slugs)
+    states = {key: {'is_bookmarked': False, 'has_life': False} for key in ids + slugs}
+    if not states or not user.is_authenticated:
+        return states
+
+    lookup = Q(post_id__in=ids) | Q(post__slug__in=slugs)
+    bookmarked = Bookmark.objects.filter(lookup, user=user).values_list('post_id', 'post__slug')
+    lives = Vote.objects.filter(lookup, user=user, is_life=True).values_list('post_id', 'post__slug')
+
+    for flag, rows in (('is_bookmarked', bookmarked), ('has_life', lives)):
+        for post_id, slug in rows:
+            for key in (post_id, slug):
+                if key in states:
+                    states[key][flag] = True
+    return states
+
+
+def attach_post_states(user, posts):
+    """Set ``is_bookmarked`` and ``has_life`` on each post for templates"""
+    posts = list(posts)
+    states = get_post_states(user, ids=[post.id for post in posts])
+    for post in posts:
+        post.is_bookmarked = states[post.id]['is_bookmarked']
+        post.has_life = states[post.id]['has_life']
+    return posts
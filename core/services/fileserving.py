@@ -0,0 +1,233 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.static import was_modified_since
+
+DEFAULT_MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 31536000
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Upload types browsers may render inline; SVG is left out as it can run script
+INLINE_UPLOAD_TYPES = frozenset({
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif', 'image/bmp',
+})
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def resolve_file(root, path):
+    """Absolute path of a regular file under `root`, or Http404"""
+    try:
+        full_path = safe_join(root, path)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404('Invalid path')
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404('File not found')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('File not found')
+    return full_path, st
+
+
+def file_etag(st):
+    """Strong validator from size and modification time, no read needed"""
+    return quote_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}')
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range header.
+
+    Returns None to serve the whole file (no header, or a multi-range or
+    malformed one, which RFC 9110 lets servers ignore) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+# Precompressed siblings in order of preference
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(header):
+    """Codings the client accepts, from an Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def precompressed_variant(root, path, accept_encoding):
+    """(path, coding) of the best precompressed sibling the client accepts"""
+    accepted = accepted_encodings(accept_encoding)
+    for coding, suffix in ENCODING_SUFFIXES:
+        if coding in accepted or '*' in accepted:
+            try:
+                full_path = safe_join(root, path + suffix)
+            except (SuspiciousFileOperation, ValueError):
+                return path, None
+            if os.path.isfile(full_path):
+                return path + suffix, coding
+    return path, None
+
+
+def cache_control(immutable):
+    if immutable:
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f"public, max-age={getattr(settings, 'FILE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)}"
+
+
+def sendfile_response(full_path, roots):
+    """An empty response the front-end server fills from disk, if configured.
+
+    FILE_SENDFILE_BACKEND 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+    passes the absolute path; 'x-accel-redirect' (nginx) maps it onto an
+    internal location via FILE_ACCEL_REDIRECT_LOCATIONS, a {root: prefix}
+    dict. The server then handles Range itself.
+    """
+    backend = getattr(settings, 'FILE_SENDFILE_BACKEND', None)
+    if backend == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = full_path
+        return response
+    if backend == 'x-accel-redirect':
+        locations = getattr(settings, 'FILE_ACCEL_REDIRECT_LOCATIONS', {})
+        for root in roots:
+            prefix = locations.get(str(root))
+            if prefix is None:
+                continue
+            relative = os.path.relpath(full_path, root).replace(os.sep, '/')
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{relative}"
+            return response
+    return None
+
+
+def serve_file(request, root, path, immutable=False, content_type=None, content_encoding=None, vary=None, inline_types=None):
+    """Serve `path` under `root` with validators, caching and byte ranges.
+
+    Conditional requests are answered from a single stat. Immutable files
+    (names that change whenever their bytes do) get a one-year
+    ``immutable`` lifetime so browsers skip revalidation entirely. With a
+    sendfile backend configured the bytes are left to the front-end server.
+
+    With `inline_types` set (user uploads), any other type is sent as an
+    ``application/octet-stream`` attachment so the browser never renders it
+    on the site's origin, and ``nosniff`` stops it guessing otherwise.
+    """
+    full_path, st = resolve_file(root, path)
+    etag = file_etag(st)
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Cache-Control': cache_control(immutable),
+        'Accept-Ranges': 'bytes',
+    }
+    if vary:
+        headers['Vary'] = vary
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    else:
+        not_modified = not was_modified_since(request.headers.get('If-Modified-Since'), st.st_mtime)
+    if not_modified:
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    if content_type is None:
+        content_type, guessed_encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        if content_encoding is None and guessed_encoding:
+            content_encoding = guessed_encoding
+    attachment = inline_types is not None and (content_type not in inline_types or content_encoding)
+    if attachment:
+        content_type, content_encoding = 'application/octet-stream', None
+
+    response = sendfile_response(full_path, [root])
+    if response is not None:
+        response['Content-Type'] = content_type
+    else:
+        response = _byte_response(request, full_path, st, etag, content_type)
+    for header, value in headers.items():
+        response[header] = value
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    if inline_types is not None:
+        response['X-Content-Type-Options'] = 'nosniff'
+    if attachment:
+        response['Content-Disposition'] = 'attachment'
+    return response
+
+
+def _byte_response(request, full_path, st, etag, content_type):
+    size = st.st_size
+    byte_range = None
+    # If-Range: only honour the range when the client's copy is current
+    if_range = request.headers.get('If-Range')
+    if request.method in ('GET', 'HEAD') and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(full_path, start, length), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return response
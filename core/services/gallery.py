@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Max
+
+from ..models import BlogImage
+from ..storage import ContentAddressedStorage
+from .imagejobs import enqueue_image_jobs
+from .images import metadata_values, normalize_upload, upload_metadata
+from .mediablobs import add_references, deferred_releases
+
+
+def add_gallery_images(post, files, captions=()):
+    """Append uploads to a post's gallery in one transaction.
+
+    The current highest ``order`` is read once and every row goes in with a
+    single bulk_create, so the query count does not grow with the number of
+    files. bulk_create sends no model signals, so the image jobs and blob
+    references those would have created are written here in bulk too.
+    """
+    files = [normalize_upload(upload) or upload for upload in files]
+    if not files:
+        return []
+    captions = list(captions)
+    with transaction.atomic():
+        last = post.images.aggregate(last=Max('order'))['last']
+        start = 0 if last is None else last + 1
+        images = [
+            BlogImage(
+                post=post,
+                image=upload,
+                caption=captions[i] if i < len(captions) else '',
+                order=start + i,
+                image_ready=False,
+                **metadata_values('image', upload_metadata(upload))
+            )
+            for i, upload in enumerate(files)
+        ]
+        BlogImage.objects.bulk_create(images)
+        enqueue_image_jobs(images, 'image')
+        storage = BlogImage._meta.get_field('image').storage
+        if isinstance(storage, ContentAddressedStorage):
+            add_references(image.image.name for image in images if storage.is_blob_name(image.image.name))
+    return images
+
+
+def reorder_gallery_images(post, image_ids):
+    """Set gallery order to match `image_ids` with one bulk UPDATE.
+
+    `image_ids` must list every image of the post exactly once; returns False
+    (and changes nothing) for any other list.
+    """
+    images = {image.id: image for image in post.images.only('id', 'post_id', 'order')}
+    if len(image_ids) != len(images) or set(image_ids) != images.keys():
+        return False
+    changed = []
+    for order, image_id in enumerate(image_ids):
+        image = images[image_id]
+        if image.order != order:
+            image.order = order
+            changed.append(image)
+    BlogImage.objects.bulk_update(changed, ['order'])
+    return True
+
+
+def remove_gallery_images(post, image_ids=None):
+    """Delete the given gallery images (all of them when no ids are given)"""
+    images = post.images.all()
+    if image_ids is not None:
+        images = images.filter(id__in=image_ids)
+    with deferred_releases():
+        deleted, _ = images.delete()
+    return deleted
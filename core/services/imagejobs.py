@@ -0,0 +1,167 @@
+import os
+import logging
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from ..models import ImageJob
+from .images import image_metadata, load_image, metadata_values, normalize_image, write_renditions
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# Seconds a claimed job may stay in processing before another worker takes it over
+DEFAULT_JOB_LEASE = 15 * 60
+
+
+def process_image(name):
+    """All image work for one stored file; safe to run in a worker process.
+
+    The image is decoded once for both the renditions and the metadata,
+    which is returned for the caller to store.
+    """
+    original = load_image(name)
+    write_renditions(original, name)
+    return image_metadata(original, name)
+
+
+def normalize_stored(name):
+    """Normalize an already stored image; runs in a worker process.
+
+    Returns ``(bytes, ext)`` for a replacement file, or None when the
+    stored file is already normalized.
+    """
+    with default_storage.open(name, 'rb') as source:
+        return normalize_image(source)
+
+
+def mark_ready(model_label, object_id, field_name, name, metadata=None):
+    """Flip ``<field>_ready`` and store metadata unless the file was replaced"""
+    model = apps.get_model(model_label)
+    return model.objects.filter(pk=object_id, **{field_name: name}).update(
+        **{f'{field_name}_ready': True},
+        **metadata_values(field_name, metadata or {})
+    )
+
+
+def enqueue_image_job(instance, field_name):
+    """Queue processing for a freshly uploaded image.
+
+    With IMAGE_JOBS_ASYNC disabled the work runs inline instead, which is
+    handy in development when no worker is running.
+    """
+    name = getattr(instance, field_name).name
+    if not getattr(settings, 'IMAGE_JOBS_ASYNC', True):
+        metadata = process_image(name)
+        mark_ready(instance._meta.label, instance.pk, field_name, name, metadata)
+        return None
+    return ImageJob.objects.create(
+        model=instance._meta.label,
+        object_id=instance.pk,
+        field_name=field_name,
+        name=name
+    )
+
+
+def enqueue_image_jobs(instances, field_name):
+    """Queue processing for many saved instances with one INSERT.
+
+    For rows written with bulk_create, which sends no model signals.
+    """
+    instances = [instance for instance in instances if getattr(instance, field_name)]
+    if not getattr(settings, 'IMAGE_JOBS_ASYNC', True):
+        for instance in instances:
+            enqueue_image_job(instance, field_name)
+        return []
+    return ImageJob.objects.bulk_create([
+        ImageJob(
+            model=instance._meta.label,
+            object_id=instance.pk,
+            field_name=field_name,
+            name=getattr(instance, field_name).name
+        )
+        for instance in instances
+    ])
+
+
+def claim_jobs(limit):
+    """Atomically move up to `limit` pending jobs to processing.
+
+    Each call stamps the rows it moves with its own claim token and only
+    returns those, so a job another worker claimed between the SELECT and
+    the UPDATE (SQLite has no SKIP LOCKED) is never processed twice.
+    """
+    claim = uuid.uuid4()
+    with transaction.atomic():
+        pending = ImageJob.objects.filter(status='pending').order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list('id', flat=True)[:limit])
+        ImageJob.objects.filter(id__in=ids, status='pending').update(
+            status='processing', claim=claim, updated_at=timezone.now()
+        )
+    return list(ImageJob.objects.filter(claim=claim, status='processing'))
+
+
+def release_stale_jobs(lease=None):
+    """Requeue jobs left in processing by a worker that died.
+
+    Only jobs claimed more than `lease` seconds ago (IMAGE_JOB_LEASE) are
+    taken back, so starting another worker leaves running ones alone.
+    """
+    if lease is None:
+        lease = getattr(settings, 'IMAGE_JOB_LEASE', DEFAULT_JOB_LEASE)
+    cutoff = timezone.now() - timedelta(seconds=lease)
+    return ImageJob.objects.filter(status='processing', updated_at__lt=cutoff).update(
+        status='pending', claim=None, updated_at=timezone.now()
+    )
+
+
+def finish_job(job, error=None, metadata=None):
+    job.attempts += 1
+    if error is None:
+        job.status = 'done'
+        job.error = ''
+        mark_ready(job.model, job.object_id, job.field_name, job.name, metadata)
+    else:
+        job.status = 'failed' if job.attempts >= MAX_ATTEMPTS else 'pending'
+        job.error = error
+        if job.status == 'failed':
+            # Give up on renditions; pages show the original instead of a spinner
+            mark_ready(job.model, job.object_id, job.field_name, job.name)
+    job.save(update_fields=['status', 'attempts', 'error', 'updated_at'])
+
+
+def run_jobs(executor, batch_size):
+    """Process one batch of jobs on `executor`; returns (done, failed)"""
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0, 0
+    # Worker processes only touch files; the DB stays with this process
+    connections.close_all()
+    futures = [(job, executor.submit(process_image, job.name)) for job in jobs]
+
+    done = failed = 0
+    for job, future in futures:
+        try:
+            metadata = future.result()
+        except Exception as e:
+            logger.warning('Image job %s for %s failed: %s', job.id, job.name, e)
+            finish_job(job, error=str(e))
+            failed += 1
+        else:
+            finish_job(job, metadata=metadata)
+            done += 1
+    return done, failed
+
+
+def init_worker():
+    """Executor initializer so spawned worker processes have Django set up"""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'writoria.settings')
+    django.setup()
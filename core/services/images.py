@@ -0,0 +1,262 @@
+import base64
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+DEFAULT_RENDITION_WIDTHS = (320, 640, 1280)
+DEFAULT_RENDITION_QUALITY = 80
+
+DEFAULT_MAX_EDGE = 2560
+DEFAULT_INGEST_QUALITY = 85
+
+# Formats kept as they are on ingest; anything else is re-encoded to JPEG
+# (or PNG when it has transparency)
+_INGEST_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Image.info keys that carry metadata rather than pixels
+_METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+
+# Longest edge of the blurred placeholder inlined into pages as a data URI
+LQIP_SIZE = 16
+LQIP_QUALITY = 30
+
+# Suffixes of the metadata columns stored next to every rendition field
+METADATA_FIELDS = ('width', 'height', 'bytes', 'color', 'lqip')
+EMPTY_METADATA = {'width': None, 'height': None, 'bytes': None, 'color': '', 'lqip': ''}
+
+# Fallback format for the same-format renditions, keyed on the original
+# extension; anything else is served as JPEG
+_FALLBACK_FORMATS = {
+    '.jpg': ('jpg', 'JPEG'),
+    '.jpeg': ('jpg', 'JPEG'),
+    '.png': ('png', 'PNG'),
+    '.webp': ('webp', 'WEBP'),
+}
+
+
+def rendition_widths():
+    return tuple(getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_RENDITION_WIDTHS))
+
+
+def target_widths(original_width=None):
+    """Rendition widths worth making for an original `original_width` pixels wide.
+
+    Only widths below the original's are made; the original itself serves
+    its own width. With the width unknown every configured width is listed.
+    """
+    widths = rendition_widths()
+    if not original_width:
+        return widths
+    return tuple(width for width in widths if width < original_width)
+
+
+def fallback_format(name):
+    """(extension, Pillow format) of the non-WebP renditions for `name`"""
+    return _FALLBACK_FORMATS.get(os.path.splitext(name)[1].lower(), ('jpg', 'JPEG'))
+
+
+def rendition_name(name, width, ext):
+    """Storage name of a rendition, stored next to its original"""
+    root = os.path.splitext(name)[0]
+    return f'{root}.w{width}.{ext}'
+
+
+def rendition_names(name):
+    """Every rendition name generated for an original"""
+    ext, _ = fallback_format(name)
+    names = []
+    for width in rendition_widths():
+        names.append(rendition_name(name, width, 'webp'))
+        if ext != 'webp':
+            names.append(rendition_name(name, width, ext))
+    return names
+
+
+def has_renditions(field_file):
+    """Cheap check for the largest rendition of a stored image"""
+    widths = target_widths(getattr(field_file.instance, f'{field_file.field.name}_width', None))
+    if not widths:
+        # Narrower than every rendition: the original is all there is
+        return True
+    return field_file.storage.exists(rendition_name(field_file.name, max(widths), 'webp'))
+
+
+def _encode(image, fmt, quality):
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        image.save(buffer, fmt, quality=quality, method=4)
+    else:
+        image.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def load_image(name, storage=default_storage):
+    """Decode a stored image, upright and in a mode every encoder accepts"""
+    with storage.open(name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+    return original
+
+
+def write_renditions(original, name, storage=default_storage):
+    """Write fixed-width WebP and same-format variants of a decoded image.
+
+    Only widths below the original's are written; an image is never
+    upscaled or copied at its own size, since the original already serves
+    that width. Returns the list of rendition names written.
+    """
+    quality = getattr(settings, 'IMAGE_RENDITION_QUALITY', DEFAULT_RENDITION_QUALITY)
+    ext, fmt = fallback_format(name)
+    targets = [('webp', 'WEBP')]
+    if ext != 'webp':
+        targets.append((ext, fmt))
+    widths = target_widths(original.width)
+
+    written = []
+    for width in sorted(rendition_widths(), reverse=True):
+        if width not in widths:
+            # Drop copies an earlier version wrote at or above the original width
+            for target_ext, _ in targets:
+                stale = rendition_name(name, width, target_ext)
+                if storage.exists(stale):
+                    storage.delete(stale)
+            continue
+        height = max(1, round(original.height * width / original.width))
+        image = original.resize((width, height), Image.LANCZOS)
+        for target_ext, target_fmt in targets:
+            target = rendition_name(name, width, target_ext)
+            if storage.exists(target):
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(_encode(image, target_fmt, quality))))
+    return written
+
+
+def generate_renditions(name, storage=default_storage):
+    """Write fixed-width WebP and same-format variants of a stored image"""
+    return write_renditions(load_image(name, storage), name, storage)
+
+
+def dominant_color(image):
+    """Most common colour of a small palette-reduced copy, as #rrggbb"""
+    small = image.convert('RGB')
+    small.thumbnail((64, 64))
+    palette = small.quantize(colors=5)
+    count, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def lqip_data_uri(image):
+    """A tiny blurred WebP of the image, small enough to inline in HTML"""
+    small = image.convert('RGB')
+    small.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    data = base64.b64encode(_encode(small, 'WEBP', LQIP_QUALITY)).decode()
+    return f'data:image/webp;base64,{data}'
+
+
+def image_metadata(image, name, storage=default_storage):
+    """Everything the templates need to lay out an image without opening it"""
+    return {
+        'width': image.width,
+        'height': image.height,
+        'bytes': storage.size(name),
+        'color': dominant_color(image),
+        'lqip': lqip_data_uri(image),
+    }
+
+
+def upload_metadata(file):
+    """Dimensions and size of an upload, read from its header only"""
+    width, height = get_image_dimensions(file)
+    return {'width': width, 'height': height, 'bytes': file.size, 'color': '', 'lqip': ''}
+
+
+def normalize_image(source):
+    """Re-encode an upload upright, without metadata and within the size cap.
+
+    JPEGs are opened in draft mode, so libjpeg decodes straight to the
+    nearest 1/2, 1/4 or 1/8 scale above the cap instead of decoding every
+    pixel of a phone photo and shrinking afterwards. Returns ``(bytes, ext)``,
+    or None when the image already needs no changes (or is animated, which
+    re-encoding would flatten).
+    """
+    max_edge = getattr(settings, 'IMAGE_MAX_EDGE', DEFAULT_MAX_EDGE)
+    quality = getattr(settings, 'IMAGE_INGEST_QUALITY', DEFAULT_INGEST_QUALITY)
+
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    image = Image.open(source)
+    # exif_transpose returns a copy without .format, so remember it here
+    source_format = image.format
+    if getattr(image, 'is_animated', False):
+        return None
+    oversized = max(image.size) > max_edge
+    has_metadata = any(key in image.info for key in _METADATA_KEYS) or bool(image.getexif())
+    if source_format in _INGEST_FORMATS and not oversized and not has_metadata:
+        return None
+
+    if source_format == 'JPEG' and oversized:
+        image.draft('RGB', (max_edge, max_edge))
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    fmt = source_format if source_format in _INGEST_FORMATS else ('PNG' if has_alpha else 'JPEG')
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    # Only the colour profile survives; EXIF, XMP and comments are dropped.
+    # Pillow writes some of them back from .info unless they are removed
+    for key in _METADATA_KEYS:
+        image.info.pop(key, None)
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    buffer = BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, fmt, quality=quality, optimize=True, progressive=True, **options)
+    elif fmt == 'WEBP':
+        image.save(buffer, fmt, quality=quality, method=4, **options)
+    else:
+        image.save(buffer, fmt, optimize=True, **options)
+    return buffer.getvalue(), _INGEST_FORMATS[fmt]
+
+
+def normalize_upload(file):
+    """Normalized copy of an uploaded file, or None to keep it as it is"""
+    try:
+        result = normalize_image(file)
+    except (UnidentifiedImageError, OSError):
+        # Not something Pillow can read; validation is left to the form
+        result = None
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    if result is None:
+        return None
+    data, ext = result
+    root = os.path.splitext(os.path.basename(file.name))[0]
+    return ContentFile(data, name=f'{root}.{ext}')
+
+
+def metadata_values(field_name, metadata):
+    """Map metadata onto the ``<field>_<key>`` model columns"""
+    return {f'{field_name}_{key}': metadata[key] for key in METADATA_FIELDS if key in metadata}
+
+
+def ensure_renditions(field_file):
+    """Generate renditions for a stored image that does not have them yet"""
+    if not field_file or has_renditions(field_file):
+        return []
+    return generate_renditions(field_file.name, field_file.storage)
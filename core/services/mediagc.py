@@ -0,0 +1,136 @@
+import os
+import re
+import shutil
+import time
+
+from ..models import RENDITION_FIELDS, MediaBlob
+
+# Matches rendition names written by core.services.images.rendition_name
+_RENDITION_RE = re.compile(r'^(?P<root>.+)\.w\d+\.[A-Za-z0-9]+$')
+
+
+class MediaScan:
+    """Running totals for a pass over MEDIA_ROOT"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.files = 0
+        self.bytes = 0
+        self.orphans = 0
+        self.orphan_bytes = 0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rate(self):
+        """Files scanned per second"""
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+
+def referenced_names(names):
+    """The subset of `names` that some image field points at"""
+    names = list(names)
+    found = set()
+    for model, field_name in RENDITION_FIELDS.items():
+        found.update(model.objects.filter(**{f'{field_name}__in': names}).values_list(field_name, flat=True))
+    return found
+
+
+def _walk(root, skip):
+    """Yield (directory, file entries) for every directory under `root`.
+
+    Uses os.scandir, so telling files from directories needs no stat call
+    and each file is stat'ed at most once (DirEntry caches it). Only one
+    directory listing is held at a time.
+    """
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.path in skip:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry)
+        yield path, files
+
+
+def find_orphans(root, scan, batch_size=1000, min_age=3600, skip=()):
+    """Yield batches of ``(name, path, size)`` for files nothing references.
+
+    Names are checked against the image fields ``batch_size`` at a time,
+    one query per model, so memory stays bounded by one directory (sharded
+    upload directories stay small). A rendition is kept while the original
+    it was generated from is kept. Files younger than `min_age` seconds are
+    never reported, since an upload is written to disk before its row is
+    committed.
+    """
+    cutoff = time.time() - min_age
+    skip = {os.path.abspath(path) for path in skip}
+    root = os.path.abspath(root)
+
+    for directory, entries in _walk(root, skip):
+        if not entries:
+            continue
+        relative = os.path.relpath(directory, root)
+        prefix = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+        files = {prefix + entry.name: entry for entry in entries}
+        scan.files += len(files)
+        scan.bytes += sum(entry.stat(follow_symlinks=False).st_size for entry in entries)
+
+        names = list(files)
+        referenced = set()
+        for start in range(0, len(names), batch_size):
+            referenced |= referenced_names(names[start:start + batch_size])
+
+        # Roots of originals that stay, which keeps their renditions too
+        kept_roots = set()
+        for name, entry in files.items():
+            if _RENDITION_RE.match(name) and name not in referenced:
+                continue
+            if name in referenced or entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                kept_roots.add(os.path.splitext(name)[0])
+
+        orphans = []
+        for name, entry in files.items():
+            if name in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue
+            match = _RENDITION_RE.match(name)
+            if match and match.group('root') in kept_roots:
+                continue
+            orphans.append((name, entry.path, stat.st_size))
+            if len(orphans) >= batch_size:
+                scan.orphans += len(orphans)
+                scan.orphan_bytes += sum(size for _, _, size in orphans)
+                yield orphans
+                orphans = []
+        if orphans:
+            scan.orphans += len(orphans)
+            scan.orphan_bytes += sum(size for _, _, size in orphans)
+            yield orphans
+
+
+def remove_orphans(orphans, quarantine=None):
+    """Delete orphaned files, or move them under `quarantine` keeping their path.
+
+    Blob reference rows for the removed files are dropped as well, since
+    nothing points at them any more.
+    """
+    for name, path, _ in orphans:
+        if quarantine:
+            target = os.path.join(quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    MediaBlob.objects.filter(name__in=[name for name, _, _ in orphans]).delete()
@@ -0,0 +1,111 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, direction):
+    """Pack a (value, id) position into an opaque URL-safe token"""
+    payload = json.dumps({'v': value.isoformat(), 'id': pk, 'd': direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = data['d']
+        if direction not in ('next', 'prev'):
+            raise InvalidCursor(token)
+        return datetime.fromisoformat(data['v']), int(data['id']), direction
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return self.paginator.cursor_for(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return self.paginator.cursor_for(self.object_list[0], 'prev')
+
+
+class KeysetPaginator:
+    """Newest-first pagination keyed on (field, id) instead of OFFSET.
+
+    Each page is a single indexed range query, so it costs the same no
+    matter how deep the reader goes, and no COUNT(*) is ever run.
+    """
+
+    def __init__(self, queryset, per_page, field='created_at'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def cursor_for(self, obj, direction):
+        return encode_cursor(getattr(obj, self.field), obj.pk, direction)
+
+    def page(self, cursor=None):
+        try:
+            position = decode_cursor(cursor) if cursor else None
+        except InvalidCursor:
+            position = None
+
+        field = self.field
+        if position is None:
+            rows = list(self.queryset.order_by(f'-{field}', '-id')[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+        value, pk, direction = position
+        if direction == 'next':
+            rows = list(
+                self.queryset
+                .filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+                .order_by(f'-{field}', '-id')[:self.per_page + 1]
+            )
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        rows = list(
+            self.queryset
+            .filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}))
+            .order_by(field, 'id')[:self.per_page + 1]
+        )
+        if not rows:
+            return self.page()
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, self, True, has_previous)
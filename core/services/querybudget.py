@@ -0,0 +1,85 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# Shapes repeated at least this many times in one request look like an N+1
+DEFAULT_REPEAT_THRESHOLD = 3
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+# Transaction control repeats once per atomic block, never per row
+_TRANSACTION_RE = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+
+def query_shape(sql):
+    """Normalize SQL so queries differing only by parameters compare equal"""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return ' '.join(sql.split())
+
+
+class QueryLog:
+    """Collects the SQL run through a connection's execute wrappers"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated_shapes(self, threshold=None):
+        """Return {shape: count} for shapes run at least `threshold` times"""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        counts = Counter(query_shape(sql) for sql in self.queries if not _TRANSACTION_RE.match(sql))
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+
+@contextmanager
+def record_queries(using='default'):
+    """Record every query run on `using` inside the block, DEBUG or not"""
+    log = QueryLog()
+    with connections[using].execute_wrapper(log):
+        yield log
+
+
+def get_query_budget(view_name):
+    """Declared query budget for a URL name, or None when undeclared"""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+
+
+def budget_problems(view_name, log):
+    """Describe every way a recorded request broke its budget"""
+    problems = []
+    budget = get_query_budget(view_name)
+    if budget is None:
+        problems.append(f'{view_name}: no query budget declared in QUERY_BUDGETS')
+    elif len(log) > budget:
+        problems.append(f'{view_name}: ran {len(log)} queries, budget is {budget}')
+    for shape, count in log.repeated_shapes().items():
+        problems.append(f'{view_name}: repeated {count}x (possible N+1): {shape}')
+    return problems
+
+
+def assert_query_budget(client, path, method='get', **kwargs):
+    """Test helper: request `path` and fail if it exceeds its query budget.
+
+    The URL name is taken from the resolved response, so budgets stay
+    declared in one place (settings.QUERY_BUDGETS) for tests and middleware.
+    """
+    with record_queries() as log:
+        response = getattr(client, method)(path, **kwargs)
+    view_name = response.resolver_match.view_name
+    problems = budget_problems(view_name, log)
+    if problems:
+        raise AssertionError('\n'.join(problems + log.queries))
+    return response
@@ -0,0 +1,114 @@
+import re
+from html import unescape
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'core_blogpost_fts'
+DEFAULT_SEARCH_BACKEND = 'core.services.search.SQLiteFTSBackend'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_text(content):
+    """Plain text of a post body, so markup and entities like &amp; are not indexed"""
+    return unescape(strip_tags(content))
+
+
+class IContainsBackend:
+    """Fallback search that scans title and content with LIKE"""
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query)
+        )
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self, posts):
+        return 0
+
+
+class SQLiteFTSBackend(IContainsBackend):
+    """Search backed by an FTS5 virtual table keyed on the BlogPost id"""
+
+    _available = False
+
+    def is_available(self):
+        # Only a positive answer is cached; the table may appear after migrate
+        if self._available:
+            return True
+        if connection.vendor != 'sqlite':
+            return False
+        SQLiteFTSBackend._available = FTS_TABLE in connection.introspection.table_names()
+        return self._available
+
+    @staticmethod
+    def build_match(query):
+        """Turn free text into an FTS5 MATCH expression.
+
+        Every word must match and the last one is treated as a prefix so
+        results keep up while the user is still typing.
+        """
+        tokens = _TOKEN_RE.findall(query.lower())
+        if not tokens:
+            return ''
+        terms = ['"%s"' % token for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def filter(self, queryset, query):
+        if not self.is_available():
+            return super().filter(queryset, query)
+        match = self.build_match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match]
+        ))
+
+    def index(self, post):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+                [post.pk, post.title, search_text(post.content)]
+            )
+
+    def remove(self, post_id):
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self, posts):
+        if not self.is_available():
+            return 0
+        indexed = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            for post in posts:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+                    [post.pk, post.title, search_text(post.content)]
+                )
+                indexed += 1
+        return indexed
+
+
+def get_search_backend():
+    """Return the backend configured by BLOG_SEARCH_BACKEND"""
+    path = getattr(settings, 'BLOG_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
@@ -0,0 +1,218 @@
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from ..models import ChunkedUpload
+
+DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024
+DEFAULT_MAX_FILES = 20
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_IMAGE_DIMENSION = 8000
+DEFAULT_MAX_IMAGE_PIXELS = 40_000_000
+DEFAULT_EXPIRY_HOURS = 24
+
+# Request bodies are copied to disk in pieces of this size
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    status = 400
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+class OffsetMismatch(UploadError):
+    """The client's offset disagrees with what the server has stored"""
+    status = 409
+
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+def max_file_size():
+    return getattr(settings, 'UPLOAD_MAX_FILE_SIZE', DEFAULT_MAX_FILE_SIZE)
+
+
+def max_files():
+    return getattr(settings, 'UPLOAD_MAX_FILES', DEFAULT_MAX_FILES)
+
+
+def chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def upload_path(upload):
+    root = getattr(settings, 'CHUNKED_UPLOAD_ROOT', os.path.join(settings.BASE_DIR, 'uploads'))
+    return os.path.join(root, f'{upload.id.hex}.part')
+
+
+def check_image_header(path, complete):
+    """Validate format and dimensions from the image header alone.
+
+    Pillow only parses the header on open, so an oversized image is turned
+    away before a single pixel is decoded. Partial files that do not hold a
+    whole header yet are let through until the upload completes.
+    """
+    limit = getattr(settings, 'UPLOAD_MAX_IMAGE_DIMENSION', DEFAULT_MAX_IMAGE_DIMENSION)
+    max_pixels = getattr(settings, 'UPLOAD_MAX_IMAGE_PIXELS', DEFAULT_MAX_IMAGE_PIXELS)
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        if complete:
+            raise UploadError('File is not a valid image')
+        return
+    if width > limit or height > limit or width * height > max_pixels:
+        raise UploadTooLarge(f'Image is {width}x{height}, the limit is {limit}x{limit}')
+
+
+def start_upload(user, filename, size):
+    """Reserve an upload of `size` bytes and create its empty part file"""
+    filename = os.path.basename(str(filename or '')).strip()
+    if not filename:
+        raise UploadError('A filename is required')
+    try:
+        validate_image_file_extension(File(None, name=filename))
+    except ValidationError:
+        raise UploadError('Only image files can be uploaded')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('Size must be a positive number of bytes')
+    if size > max_file_size():
+        raise UploadTooLarge(f'Files are limited to {max_file_size()} bytes')
+    if ChunkedUpload.objects.filter(user=user).count() >= max_files():
+        raise UploadError(f'At most {max_files()} uploads can be pending at once')
+
+    upload = ChunkedUpload.objects.create(user=user, filename=filename, size=size)
+    path = upload_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """Write `length` bytes read from `stream` at `offset`.
+
+    The offset must match the stored one, so a client that lost its
+    connection asks for the current offset and resumes from there. Bytes
+    are copied to disk in small pieces and never buffered whole; whatever
+    arrived before a disconnect is kept. Returns the updated upload.
+    """
+    if upload.status == 'complete':
+        raise UploadError('Upload is already complete')
+    if offset != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    if length > chunk_size():
+        raise UploadTooLarge(f'Chunks are limited to {chunk_size()} bytes')
+    if offset + length > upload.size:
+        raise UploadTooLarge('Chunk runs past the declared size')
+
+    path = upload_path(upload)
+    written = 0
+    with open(path, 'r+b') as part:
+        # Drop anything past the recorded offset from an interrupted write
+        part.truncate(offset)
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+
+    complete = offset + written == upload.size
+    try:
+        check_image_header(path, complete)
+    except UploadError:
+        discard_upload(upload)
+        raise
+
+    # Compare-and-set on the offset, so of two racing requests for the same
+    # part only one is recorded
+    updated = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(
+        offset=offset + written,
+        status='complete' if complete else 'uploading',
+        updated_at=timezone.now()
+    )
+    if not updated:
+        upload.refresh_from_db(fields=['offset'])
+        raise OffsetMismatch(upload.offset)
+    upload.offset = offset + written
+    upload.status = 'complete' if complete else 'uploading'
+    return upload
+
+
+def resolve_uploads(user, tokens):
+    """Completed uploads of `user` for `tokens`, in token order"""
+    try:
+        tokens = [uuid.UUID(str(token)) for token in tokens]
+    except ValueError:
+        raise UploadError('Invalid upload token')
+    uploads = ChunkedUpload.objects.filter(user=user, pk__in=tokens, status='complete').in_bulk()
+    missing = [token for token in tokens if token not in uploads]
+    if missing:
+        raise UploadError('Unknown or unfinished upload')
+    lost = [upload for upload in uploads.values() if not os.path.exists(upload_path(upload))]
+    if lost:
+        # The part file was removed (expiry, a cleared upload directory), so
+        # the row can never be used again
+        discard_uploads(lost)
+        raise UploadError(f'{lost[0].filename} is no longer available, please upload it again')
+    return [uploads[token] for token in tokens]
+
+
+@contextmanager
+def open_uploads(uploads):
+    """Yield finished uploads as files and delete them once used.
+
+    The part files are only removed when the block succeeds, so a failed
+    form submission can be retried with the same tokens. Raises UploadError
+    when a part file has gone missing since the uploads were resolved.
+    """
+    files = []
+    try:
+        for upload in uploads:
+            files.append(File(open(upload_path(upload), 'rb'), name=upload.filename))
+    except FileNotFoundError:
+        for file in files:
+            file.close()
+        raise UploadError(f'{upload.filename} is no longer available, please upload it again')
+    try:
+        yield files
+    finally:
+        for file in files:
+            file.close()
+    discard_uploads(uploads)
+
+
+def discard_uploads(uploads):
+    """Delete uploads and their part files with one DELETE"""
+    for upload in uploads:
+        try:
+            os.remove(upload_path(upload))
+        except FileNotFoundError:
+            pass
+    ChunkedUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).delete()
+
+
+def discard_upload(upload):
+    discard_uploads([upload])
+
+
+def clear_expired_uploads(hours=None):
+    """Delete uploads untouched for `hours`; returns how many were removed"""
+    if hours is None:
+        hours = getattr(settings, 'UPLOAD_EXPIRY_HOURS', DEFAULT_EXPIRY_HOURS)
+    expired = list(ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours)))
+    discard_uploads(expired)
+    return len(expired)
@@ -0,0 +1,159 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from ..models import BlogPost, Vote
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """Write-behind buffer for BlogPost.votes counter deltas.
+
+    Clicks on a hot post add to an in-process delta instead of updating the
+    same BlogPost row every time; a daemon thread flushes the coalesced
+    deltas in one transaction every `interval` seconds (and at exit). Each
+    process keeps its own buffer, which is safe because deltas are additive.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._deltas = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, post_id, delta):
+        """Buffer a delta and return the post's total pending delta"""
+        with self._lock:
+            self._deltas[post_id] += delta
+            pending = self._deltas[post_id]
+            if self._thread is None:
+                self._start()
+        return pending
+
+    def pending(self, post_id):
+        with self._lock:
+            return self._deltas.get(post_id, 0)
+
+    def flush(self):
+        """Apply all buffered deltas; returns the number of posts updated"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+        deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        try:
+            with transaction.atomic():
+                for post_id, delta in deltas.items():
+                    BlogPost.objects.filter(pk=post_id).update(votes=F('votes') + delta)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for post_id, delta in deltas.items():
+                    self._deltas[post_id] += delta
+            raise
+        return len(deltas)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush buffered votes')
+            finally:
+                close_old_connections()
+
+
+_vote_buffer = None
+_vote_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Process-wide VoteBuffer, or None unless VOTE_BUFFER_ENABLED"""
+    global _vote_buffer
+    if not getattr(settings, 'VOTE_BUFFER_ENABLED', False):
+        return None
+    with _vote_buffer_lock:
+        if _vote_buffer is None:
+            _vote_buffer = VoteBuffer(getattr(settings, 'VOTE_BUFFER_FLUSH_INTERVAL', 5))
+    return _vote_buffer
+
+
+def toggle_vote(user, post):
+    """Give or take back a user's life on a post.
+
+    The per-user Vote row and the post's ``votes`` counter change together in
+    one transaction. The toggle is a compare-and-set on ``is_life`` and the
+    counter moves by a +1/-1 F() delta, so concurrent clicks never lose an
+    update and no COUNT over the post's votes is needed. When the vote
+    buffer is enabled the counter delta is deferred to its next flush and
+    the returned count already includes it.
+    Returns ``(votes, has_life)``.
+    """
+    with transaction.atomic():
+        vote, created = Vote.objects.get_or_create(
+            user=user,
+            post=post,
+            defaults={'is_life': True}
+        )
+        if created:
+            has_life = True
+        else:
+            has_life = not vote.is_life
+            while not Vote.objects.filter(pk=vote.pk, is_life=vote.is_life).update(is_life=has_life):
+                # Another request toggled first; retry against the fresh state
+                vote.refresh_from_db(fields=['is_life'])
+                has_life = not vote.is_life
+
+        delta = 1 if has_life else -1
+        buffer = get_vote_buffer()
+        if buffer is None:
+            BlogPost.objects.filter(pk=post.pk).update(votes=F('votes') + delta)
+        votes = BlogPost.objects.filter(pk=post.pk).values_list('votes', flat=True).get()
+
+    if buffer is not None:
+        # The Vote row is committed; only the counter write is deferred
+        votes += buffer.add(post.pk, delta)
+    return votes, has_life
+
+
+def reconcile_vote_counts(posts=None):
+    """Rebuild ``BlogPost.votes`` from the Vote table in one bulk UPDATE.
+
+    Only posts whose stored counter has drifted are written. Pass a queryset
+    to limit the posts checked; returns the number of posts corrected.
+
+    Only this process's vote buffer is flushed first. Deltas still pending
+    in other workers' buffers would be added on top of the rebuilt totals
+    and count those votes twice, so run this with VOTE_BUFFER_ENABLED off
+    everywhere, or after every worker has stopped and flushed at exit.
+    """
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        buffer.flush()
+    if posts is None:
+        posts = BlogPost.objects.all()
+    actual = Coalesce(
+        Subquery(
+            Vote.objects.filter(post=OuterRef('pk'), is_life=True)
+            .order_by()
+            .values('post')
+            .annotate(total=Count('id'))
+            .values('total')
+        ),
+        0
+    )
+    drifted = posts.annotate(actual_votes=actual).exclude(votes=F('actual_votes'))
+    return BlogPost.objects.filter(pk__in=drifted.values('pk')).update(votes=actual)
@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz siblings are written
+    brotli = None
+
+BLOB_PREFIX = 'blobs'
+_BLOB_NAME_RE = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.[A-Za-z0-9]+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each distinct upload once, named by the SHA-256 of its bytes.
+
+    Uploads are hashed chunk by chunk and land at
+    ``blobs/<h[:2]>/<h[2:4]>/<h><ext>``; saving bytes that are already
+    stored returns the existing name without writing anything. Names that
+    already live under ``blobs/`` (renditions derived from a blob) are
+    stored verbatim. Because a name can never point at different bytes,
+    these files can be served with immutable cache headers.
+    """
+
+    def __init__(self, **kwargs):
+        # Two racing uploads of the same bytes write identical content, so
+        # overwriting is safe and the name never needs a random suffix
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def is_blob_name(self, name):
+        return name.replace('\\', '/').startswith(BLOB_PREFIX + '/')
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        h = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        return f'{BLOB_PREFIX}/{h[:2]}/{h[2:4]}/{h}{ext}'
+
+    def _save(self, name, content):
+        if self.is_blob_name(name):
+            return super()._save(name, content)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def is_content_addressed(name):
+    """True for blob originals, whose bytes can never change under their name"""
+    return _BLOB_NAME_RE.match(name.replace('\\', '/')) is not None
+
+
+def get_media_storage():
+    """Storage for uploaded images, content-addressed when enabled"""
+    if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', False):
+        return ContentAddressedStorage()
+    return default_storage
+
+
+def shard_name(prefix, filename, key):
+    """``<prefix>/<h[:2]>/<h[2:4]>/<filename>`` with h = sha1(key)"""
+    h = hashlib.sha1(key.encode()).hexdigest()
+    return f'{prefix}/{h[:2]}/{h[2:4]}/{os.path.basename(filename)}'
+
+
+def is_sharded(prefix, name):
+    return re.match(rf'^{re.escape(prefix)}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[^/]+$', name) is not None
+
+
+@deconstructible
+class ShardedUploadTo:
+    """upload_to that spreads files over 65,536 two-level subdirectories.
+
+    Only applies with MEDIA_CONTENT_ADDRESSED off: ContentAddressedStorage
+    names every upload after its hash under blobs/, which is sharded
+    already, so the path is then left flat. Otherwise new uploads are
+    sharded on a random key so no directory grows without bound;
+    ``shard_media`` moves older flat files using their old name as the key
+    instead, which keeps that migration repeatable.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix.rstrip('/')
+
+    def __call__(self, instance, filename):
+        if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', False):
+            return f'{self.prefix}/{os.path.basename(filename)}'
+        return shard_name(self.prefix, filename, uuid.uuid4().hex)
+
+    def __eq__(self, other):
+        return isinstance(other, ShardedUploadTo) and self.prefix == other.prefix
+
+
+# Text-like static assets worth precompressing; images and fonts already are
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+# A sibling is only written when it saves at least this fraction of the size
+MIN_COMPRESSION_SAVING = 0.05
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Content-hashed static files with .gz (and .br) siblings.
+
+    collectstatic writes ``name.<hash>.ext`` plus the manifest as usual,
+    then compresses every text asset once at the highest level so nothing
+    has to be compressed per request. core.views.serve_static picks the
+    sibling matching the client's Accept-Encoding. Unknown names fall back
+    to the unhashed file rather than raising, so templates keep working
+    before collectstatic has run.
+    """
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        compressed = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and not isinstance(processed, Exception):
+                for target in (name, hashed_name):
+                    if target and target not in compressed:
+                        compressed.add(target)
+                        self.write_compressed(target)
+            yield name, hashed_name, processed
+
+    def write_compressed(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        with self.open(name) as f:
+            data = f.read()
+        limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, payload in variants:
+            path = self.path(name + suffix)
+            if len(payload) < limit:
+                with open(path, 'wb') as f:
+                    f.write(payload)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    @cached_property
+    def hashed_names(self):
+        """Every hashed name in the manifest; these never change content"""
+        return frozenset(self.hashed_files.values())
@@ -0,0 +1,84 @@
+from django import template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from core.services.images import METADATA_FIELDS, fallback_format, rendition_name, target_widths
+
+register = template.Library()
+
+
+def stored_metadata(image):
+    """Metadata columns saved next to an image field, without touching the file"""
+    instance, name = image.instance, image.field.name
+    return {key: getattr(instance, f'{name}_{key}', None) for key in METADATA_FIELDS}
+
+
+def dimension_attrs(meta):
+    """width/height attributes so the browser reserves space before loading"""
+    if not meta['width'] or not meta['height']:
+        return ''
+    return format_html(' width="{}" height="{}"', meta['width'], meta['height'])
+
+
+def placeholder_style(meta):
+    """Dominant colour and blurred preview painted behind the image"""
+    rules = []
+    if meta['width'] and meta['height']:
+        rules.append(format_html('aspect-ratio: {} / {}', meta['width'], meta['height']))
+    if meta['color']:
+        rules.append(format_html('background-color: {}', meta['color']))
+    if meta['lqip']:
+        rules.append(format_html("background-image: url('{}'); background-size: cover", meta['lqip']))
+    if not rules:
+        return ''
+    # Each rule was escaped by format_html already
+    return format_html(' style="{}"', mark_safe('; '.join(rules)))
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes='100vw', loading='lazy'):
+    """Render an ImageField as a <picture> with WebP and fallback srcsets.
+
+    Usage: {% responsive_image post.image alt=post.title css_class="card-image" sizes="(max-width: 600px) 100vw, 400px" %}
+    """
+    if not image:
+        return ''
+    meta = stored_metadata(image)
+    # Renditions are made by the image job queue; until then show a placeholder
+    if not getattr(image.instance, f'{image.field.name}_ready', True):
+        return format_html(
+            '<div class="image-processing {}" role="img" aria-label="{}"{}>'
+            '<i class="fas fa-spinner fa-spin"></i><span>Processing image&hellip;</span>'
+            '</div>',
+            css_class, alt, placeholder_style(meta)
+        )
+    # The job stores the colour along with the renditions; a ready image
+    # without one was never processed (its job failed), so skip the srcset
+    if not meta['color']:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async"{}>',
+            image.url, alt, css_class, loading, dimension_attrs(meta)
+        )
+    storage = image.storage
+    ext, _ = fallback_format(image.name)
+    widths = target_widths(meta['width'])
+
+    def srcset(target_ext):
+        candidates = [
+            f'{storage.url(rendition_name(image.name, width, target_ext))} {width}w'
+            for width in widths
+        ]
+        # The original covers everything above the largest rendition
+        if meta['width']:
+            candidates.append(f'{image.url} {meta["width"]}w')
+        return ', '.join(candidates)
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async"{}{}>'
+        '</picture>',
+        srcset('webp'), sizes,
+        image.url, srcset(ext), sizes, alt, css_class, loading,
+        dimension_attrs(meta), placeholder_style(meta)
+    )
@@ -1,3 +1,859 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from importlib import import_module
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from PIL import Image, JpegImagePlugin
+
+from .models import BlogPost, Bookmark, ChunkedUpload, Comment, ImageJob, MediaBlob, UserProfile, Vote
+from .services.gallery import add_gallery_images, remove_gallery_images
+from .services.imagejobs import MAX_ATTEMPTS, claim_jobs, finish_job, release_stale_jobs
+from .services.images import has_renditions, normalize_image, rendition_name, write_renditions
+from .services.pagination import KeysetPaginator
+from .services.querybudget import assert_query_budget
+from .services.search import FTS_TABLE, SQLiteFTSBackend, get_search_backend
+from .services.uploads import upload_path
+from .services.votes import VoteBuffer, reconcile_vote_counts, toggle_vote
+from .storage import is_sharded
+from .templatetags.images import responsive_image
+
+
+def png(name='image.png', color='red', size=(40, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def url_names(patterns, namespace=None):
+    """Every named URL pattern, with its namespace prefix"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace == 'admin':
+                continue
+            inner = pattern.namespace or namespace
+            yield from url_names(pattern.url_patterns, inner)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}:{pattern.name}' if namespace else pattern.name
+
+
+class MediaTestCase(TestCase):
+    """TestCase whose uploads go to a throwaway MEDIA_ROOT"""
+
+    media_settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls._settings = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            CHUNKED_UPLOAD_ROOT=f'{cls.media_root}/uploads',
+            **cls.media_settings,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class QueryBudgetTests(MediaTestCase):
+    """Every budgeted view, GET and POST paths, stays within QUERY_BUDGETS"""
+
+    media_settings = {'IMAGE_JOBS_ASYNC': True, 'VOTE_BUFFER_ENABLED': False}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'secret-pass')
+        cls.post = BlogPost.objects.create(title='Budgeted post', content='<p>Some words</p>', author=cls.author)
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.reader, content='First')
+        Comment.objects.create(post=cls.post, author=cls.author, content='Reply', parent=cls.comment)
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def assertBudget(self, path, method='get', **kwargs):
+        return assert_query_budget(self.client, path, method, **kwargs)
+
+    def test_every_url_name_has_a_budget(self):
+        missing = set(url_names(get_resolver().url_patterns)) - settings.QUERY_BUDGETS.keys()
+        self.assertEqual(missing, set())
+
+    def test_pages(self):
+        slug = self.post.slug
+        for path in [
+            reverse('home'), reverse('about'), reverse('team'),
+            reverse('blog_list'), reverse('blog_list') + '?search=words',
+            reverse('blog_create'), reverse('blog_detail', args=[slug]),
+            reverse('blog_update', args=[slug]), reverse('blog_delete', args=[slug]),
+            reverse('profile'), reverse('user_profile', args=['reader']),
+            reverse('auth'), reverse('help_center'), reverse('suggestion_form'),
+            reverse('post_states') + f'?ids={self.post.id}&slugs={slug}',
+            reverse('comment_list', args=[slug]), reverse('comment_replies', args=[self.comment.id]),
+        ]:
+            with self.subTest(path=path):
+                self.assertLess(self.assertBudget(path).status_code, 400)
+
+    def test_anonymous_pages(self):
+        self.client.logout()
+        for path in [reverse('home'), reverse('blog_detail', args=[self.post.slug]), reverse('user_profile', args=['author'])]:
+            with self.subTest(path=path):
+                self.assertEqual(self.assertBudget(path).status_code, 200)
+
+    def test_blog_create_update_delete(self):
+        response = self.assertBudget(reverse('blog_create'), 'post', data={
+            'title': 'New post', 'content': 'Body', 'category': 'other',
+            'image': png('cover.png'), 'images': [png('a.png', 'blue'), png('b.png', 'green')],
+            'image_captions': 'A\nB',
+        })
+        self.assertEqual(response.status_code, 302)
+        post = BlogPost.objects.get(title='New post')
+        self.assertEqual(post.images.count(), 2)
+
+        response = self.assertBudget(reverse('blog_update', args=[post.slug]), 'post', data={
+            'title': 'New post', 'content': 'Edited', 'category': 'other', 'images': [png('c.png', 'white')],
+        })
+        self.assertEqual(response.status_code, 302)
+
+        response = self.assertBudget(reverse('blog_delete', args=[post.slug]), 'post')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(BlogPost.objects.filter(pk=post.pk).exists())
+
+    def test_gallery(self):
+        slug = self.post.slug
+        response = self.assertBudget(reverse('gallery_add', args=[slug]), 'post', data={
+            'images': [png('a.png'), png('b.png', 'blue'), png('c.png', 'green')], 'captions': ['a', 'b'],
+        })
+        self.assertEqual(response.status_code, 200)
+        ids = [image['id'] for image in response.json()['images']]
+
+        response = self.assertBudget(
+            reverse('gallery_reorder', args=[slug]), 'post',
+            data=json.dumps({'order': ids[::-1]}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.assertBudget(
+            reverse('gallery_remove', args=[slug]), 'post',
+            data=json.dumps({'ids': ids[:2]}), content_type='application/json'
+        )
+        self.assertEqual(response.json()['deleted'], 2)
+
+    def test_gallery_reorder_needs_a_permutation(self):
+        images = add_gallery_images(self.post, [png('a.png'), png('b.png', 'blue'), png('c.png', 'green')])
+        a, b, c = [image.id for image in images]
+        path = reverse('gallery_reorder', args=[self.post.slug])
+        for order in [[a, a, b], [a, b], [a, b, c, c], [a, b, 0]]:
+            with self.subTest(order=order):
+                response = self.client.post(path, json.dumps({'order': order}), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(self.post.images.values_list('id', flat=True)), [a, b, c])
+
+        response = self.client.post(path, json.dumps({'order': [c, a, b]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.post.images.values_list('id', flat=True)), [c, a, b])
+
+    def test_chunked_upload(self):
+        data = png().read()
+        response = self.assertBudget(
+            reverse('upload_start'), 'post',
+            data=json.dumps({'filename': 'photo.png', 'size': len(data)}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+
+        response = self.assertBudget(
+            reverse('upload_chunk', args=[token]), 'patch',
+            data=data, content_type='application/offset+octet-stream', headers={'Upload-Offset': '0'}
+        )
+        self.assertTrue(response.json()['complete'])
+        self.assertBudget(reverse('upload_chunk', args=[token]))
+
+    def test_bookmark_and_vote(self):
+        slug = self.post.slug
+        for _ in range(2):
+            self.assertEqual(self.assertBudget(reverse('toggle_bookmark', args=[slug]), 'post').status_code, 200)
+        # First vote creates the row, the second toggles it back
+        for has_life in (True, False):
+            response = self.assertBudget(reverse('vote_post', args=[slug]), 'post')
+            self.assertEqual(response.json()['has_life'], has_life)
+
+    def test_comments(self):
+        slug = self.post.slug
+        response = self.assertBudget(
+            reverse('add_comment', args=[slug]), 'post',
+            data=json.dumps({'content': 'Nice', 'parent_id': self.comment.id}), content_type='application/json'
+        )
+        comment_id = response.json()['comment_id']
+        response = self.assertBudget(reverse('delete_comment', args=[comment_id]), 'post')
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_avatar(self):
+        data = {'bio': 'Writer', 'website': ''}
+        response = self.assertBudget(reverse('profile'), 'post', data={**data, 'avatar': png('me.png')})
+        self.assertEqual(response.status_code, 302)
+        # Replacing the avatar also releases the old file
+        response = self.assertBudget(reverse('profile'), 'post', data={**data, 'avatar': png('me2.png', 'blue')})
+        self.assertEqual(response.status_code, 302)
+        response = self.assertBudget(reverse('profile'), 'post', data=data)
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_profile_avatar_inline(self):
+        # Dimensions, colour and LQIP go out with the ready flag, in the same UPDATE
+        response = self.assertBudget(reverse('profile'), 'post', data={'bio': '', 'website': '', 'avatar': png('me.png')})
+        self.assertEqual(response.status_code, 302)
+        profile = UserProfile.objects.get(user=self.author)
+        self.assertTrue(profile.avatar_ready)
+        self.assertEqual((profile.avatar_width, profile.avatar_height), (40, 30))
+        self.assertEqual(profile.avatar_color, '#ff0000')
+        self.assertTrue(profile.avatar_lqip.startswith('data:image/webp'))
+
+    def test_auth(self):
+        self.client.logout()
+        response = self.assertBudget(reverse('auth'), 'post', data={
+            'action': 'login', 'username': 'reader', 'password': 'secret-pass',
+        })
+        self.assertEqual(response.status_code, 302)
+        response = self.assertBudget(reverse('logout'), 'post')
+        self.assertEqual(response.status_code, 302)
+
+    def test_file_serving(self):
+        self.client.logout()
+        name = 'budget/file.png'
+        os.makedirs(os.path.join(self.media_root, 'budget'))
+        with open(os.path.join(self.media_root, name), 'wb') as f:
+            f.write(png().read())
+        response = self.assertBudget(f'{settings.MEDIA_URL}{name}')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        static_root = os.path.join(self.media_root, 'static')
+        os.makedirs(os.path.join(static_root, 'css'))
+        with open(os.path.join(static_root, 'css', 'site.css'), 'w') as f:
+            f.write('body { margin: 0 }')
+        with override_settings(STATIC_ROOT=static_root):
+            response = self.assertBudget(f'{settings.STATIC_URL}css/site.css')
+        self.assertEqual(response.status_code, 200)
+
+
+class SearchTests(TestCase):
+    """The FTS5 index behind the blog list search"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+
+    def post(self, title, content):
+        return BlogPost.objects.create(title=title, content=content, author=self.author)
+
+    def search(self, query):
+        return list(get_search_backend().filter(BlogPost.objects.order_by('id'), query))
+
+    def test_uses_the_fts_index(self):
+        self.assertTrue(SQLiteFTSBackend().is_available())
+        self.assertEqual(SQLiteFTSBackend.build_match('Good intros?'), '"good" "intros"*')
+
+    def test_every_word_must_match_and_the_last_is_a_prefix(self):
+        travel = self.post('Packing light', '<p>Travelling with one bag</p>')
+        tech = self.post('Light themes', '<p>Editors for writers</p>')
+        self.assertEqual(self.search('light'), [travel, tech])
+        self.assertEqual(self.search('light trav'), [travel])
+        # Porter stemming: "travel" finds "Travelling"
+        self.assertEqual(self.search('travel'), [travel])
+        self.assertEqual(self.search('?!'), [])
+
+    def test_markup_and_entities_are_not_indexed(self):
+        post = self.post('Seasoning', '<p class="lead">Salt &amp; pepper</p>')
+        self.assertEqual(self.search('pepper'), [post])
+        self.assertEqual(self.search('amp'), [])
+        self.assertEqual(self.search('lead'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        post = self.post('Draft title', 'Body')
+        post.title = 'Final title'
+        post.save()
+        self.assertEqual(self.search('draft'), [])
+        self.assertEqual(self.search('final'), [post])
+        post.delete()
+        self.assertEqual(self.search('final'), [])
+
+    def test_list_view_searches_newest_first(self):
+        older = self.post('Editing tips', 'Cut the adverbs')
+        newer = self.post('More editing', 'Read it aloud')
+        response = self.client.get(reverse('blog_list'), {'search': 'editing'})
+        self.assertEqual(list(response.context['posts']), [newer, older])
+
+    def test_migration_skips_the_index_without_fts5(self):
+        migration = import_module('core.migrations.0012_blogpost_search_index')
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'sqlite'
+        schema_editor.connection.alias = 'default'
+        schema_editor.execute.side_effect = OperationalError('no such module: fts5')
+        migration.create_search_index(mock.Mock(), schema_editor)
+        schema_editor.execute.assert_called_once()
+        self.assertIn(FTS_TABLE, schema_editor.execute.call_args.args[0])
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages over (created_at, id)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+        for i in range(25):
+            BlogPost.objects.create(title=f'Post {i}', content='Body', author=cls.author)
+        # Ties on created_at are broken by id
+        first = BlogPost.objects.order_by('id').first()
+        BlogPost.objects.filter(id__lte=first.id + 4).update(created_at=first.created_at)
+
+    def setUp(self):
+        self.expected = list(BlogPost.objects.order_by('-created_at', '-id'))
+        self.paginator = KeysetPaginator(BlogPost.objects.all(), 10)
+
+    def test_next_cursors_walk_every_post_once(self):
+        seen = []
+        page = self.paginator.page()
+        self.assertFalse(page.has_previous())
+        while True:
+            seen.extend(page)
+            if not page.has_next():
+                break
+            page = self.paginator.page(page.next_cursor)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(page.next_cursor, '')
+
+    def test_previous_cursor_returns_the_page_before(self):
+        second = self.paginator.page(self.paginator.page().next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), self.expected[10:20])
+        self.assertTrue(back.has_previous() and back.has_next())
+        first = self.paginator.page(back.previous_cursor)
+        self.assertEqual(list(first), self.expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor_falls_back_to_the_first_page(self):
+        for cursor in ['garbage', 'e30', '!!']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(self.paginator.page(cursor)), self.expected[:10])
+
+    def test_each_page_is_one_query(self):
+        cursor = self.paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            list(self.paginator.page(cursor))
+
+    def test_profile_pagers_keep_the_other_cursor(self):
+        for post in self.expected[:11]:
+            Bookmark.objects.create(user=self.author, post=post)
+        self.client.force_login(self.author)
+        bookmarks_cursor = self.client.get(reverse('profile')).context['bookmarks'].next_cursor
+
+        response = self.client.get(reverse('profile'), {'bookmarks_cursor': bookmarks_cursor})
+        posts_cursor = response.context['user_posts'].next_cursor
+        self.assertContains(response, f'?bookmarks_cursor={bookmarks_cursor}&amp;posts_cursor={posts_cursor}')
+
+
+@override_settings(VOTE_BUFFER_ENABLED=False)
+class VoteTests(TestCase):
+    """toggle_vote keeps the Vote rows and the votes counter in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+        cls.readers = [User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'secret-pass') for i in range(3)]
+        cls.post = BlogPost.objects.create(title='Voted post', content='Body', author=cls.author)
+
+    def votes(self):
+        return BlogPost.objects.values_list('votes', flat=True).get(pk=self.post.pk)
+
+    def test_toggle_gives_and_takes_back_a_life(self):
+        reader = self.readers[0]
+        self.assertEqual(toggle_vote(reader, self.post), (1, True))
+        self.assertEqual(toggle_vote(reader, self.post), (0, False))
+        self.assertEqual(toggle_vote(reader, self.post), (1, True))
+        self.assertEqual(Vote.objects.filter(user=reader, post=self.post).count(), 1)
+
+    def test_counter_moves_by_deltas(self):
+        for reader in self.readers:
+            toggle_vote(reader, self.post)
+        self.assertEqual(self.votes(), 3)
+        # A write from elsewhere is kept: the toggle adds to the stored value
+        # instead of writing back a total it read earlier
+        BlogPost.objects.filter(pk=self.post.pk).update(votes=F('votes') + 10)
+        self.assertEqual(toggle_vote(self.readers[0], self.post), (12, False))
+
+    def test_toggle_retries_when_the_vote_changed_underneath(self):
+        reader = self.readers[0]
+        toggle_vote(reader, self.post)
+        stale = Vote.objects.get(user=reader, post=self.post)
+        real_get_or_create = Vote.objects.get_or_create
+
+        def get_or_create_then_toggle(**kwargs):
+            vote, created = real_get_or_create(**kwargs)
+            # Another request takes the life back between our read and write
+            Vote.objects.filter(pk=stale.pk).update(is_life=False)
+            return vote, created
+
+        with mock.patch.object(Vote.objects, 'get_or_create', side_effect=get_or_create_then_toggle):
+            votes, has_life = toggle_vote(reader, self.post)
+        self.assertTrue(has_life)
+        self.assertTrue(Vote.objects.get(pk=stale.pk).is_life)
+
+
+@mock.patch.object(VoteBuffer, '_start')
+class VoteBufferTests(TestCase):
+    """Write-behind vote counters and their reconciliation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+        cls.readers = [User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'secret-pass') for i in range(3)]
+        cls.post = BlogPost.objects.create(title='Voted post', content='Body', author=cls.author)
+
+    def setUp(self):
+        self.buffer = VoteBuffer(interval=60)
+        patcher = mock.patch('core.services.votes.get_vote_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def votes(self):
+        return BlogPost.objects.values_list('votes', flat=True).get(pk=self.post.pk)
+
+    def test_deltas_wait_for_the_flush(self, start):
+        for reader in self.readers:
+            toggle_vote(reader, self.post)
+        votes, has_life = toggle_vote(self.readers[0], self.post)
+        # The reader sees the buffered total, the row does not yet
+        self.assertEqual((votes, has_life), (2, False))
+        self.assertEqual(self.votes(), 0)
+        self.assertEqual(self.buffer.pending(self.post.pk), 2)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.votes(), 2)
+        self.assertEqual(self.buffer.pending(self.post.pk), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_the_deltas(self, start):
+        self.buffer.add(self.post.pk, 2)
+        with mock.patch('core.services.votes.BlogPost.objects.filter', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.buffer.add(self.post.pk, 1)
+        self.assertEqual(self.buffer.pending(self.post.pk), 3)
+        self.buffer.flush()
+        self.assertEqual(self.votes(), 3)
+
+    def test_reconcile_flushes_and_fixes_drift(self, start):
+        for reader in self.readers[:2]:
+            toggle_vote(reader, self.post)
+        BlogPost.objects.filter(pk=self.post.pk).update(votes=7)
+        self.assertEqual(reconcile_vote_counts(), 1)
+        self.assertEqual(self.votes(), 2)
+        self.assertEqual(self.buffer.pending(self.post.pk), 0)
+        self.assertEqual(reconcile_vote_counts(), 0)
+
+    def test_command_refuses_while_buffers_may_hold_deltas(self, start):
+        BlogPost.objects.filter(pk=self.post.pk).update(votes=5)
+        with override_settings(VOTE_BUFFER_ENABLED=True):
+            with self.assertRaises(CommandError):
+                call_command('reconcile_votes', stdout=StringIO())
+            call_command('reconcile_votes', '--buffers-drained', stdout=StringIO())
+        self.assertEqual(self.votes(), 0)
+
+
+class PostStateTests(TestCase):
+    """The reader's bookmark and life on each post"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'secret-pass')
+        cls.post = BlogPost.objects.create(title='State', content='Body', author=cls.reader)
+        cls.other = BlogPost.objects.create(title='Other', content='Body', author=cls.reader)
+        Bookmark.objects.create(user=cls.reader, post=cls.post)
+        Vote.objects.create(user=cls.reader, post=cls.other, is_life=True)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_post_slugged_state_is_reachable(self):
+        self.assertEqual(self.post.slug, 'state')
+        response = self.client.get(reverse('blog_detail', args=['state']))
+        self.assertEqual(response.context['object'], self.post)
+
+    def test_states_by_id_and_slug(self):
+        response = self.client.get(reverse('post_states'), {'ids': f'{self.other.id},x', 'slugs': 'state'})
+        self.assertEqual(response.json()['posts'], {
+            str(self.other.id): {'is_bookmarked': False, 'has_life': True},
+            'state': {'is_bookmarked': True, 'has_life': False},
+        })
+
+    def test_list_marks_bookmarks_and_lives(self):
+        response = self.client.get(reverse('blog_list'))
+        self.assertContains(response, 'class="bookmarked-badge"', count=1)
+        self.assertContains(response, 'class="lives active"', count=1)
+
+
+class ChunkedUploadTests(MediaTestCase):
+    """Resumable uploads: offsets, resuming after a cut, and lost part files"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', 'writer@example.com', 'secret-pass')
+        self.client.force_login(self.user)
+        self.data = png(size=(200, 150)).read()
+
+    def start(self):
+        response = self.client.post(
+            reverse('upload_start'), json.dumps({'filename': 'photo.png', 'size': len(self.data)}),
+            content_type='application/json'
+        )
+        return response.json()['token']
+
+    def send(self, token, offset, data):
+        return self.client.patch(
+            reverse('upload_chunk', args=[token]), data,
+            content_type='application/offset+octet-stream', headers={'Upload-Offset': str(offset)}
+        )
+
+    def test_resume_from_the_stored_offset(self):
+        token = self.start()
+        half = len(self.data) // 2
+        self.assertEqual(self.send(token, 0, self.data[:half]).json()['offset'], half)
+
+        # A client that lost track resends from 0 and is told where to resume
+        response = self.send(token, 0, self.data[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        state = self.client.get(reverse('upload_chunk', args=[token])).json()
+        self.assertEqual((state['offset'], state['complete']), (half, False))
+
+        response = self.send(token, half, self.data[half:])
+        self.assertTrue(response.json()['complete'])
+        with open(upload_path(ChunkedUpload.objects.get(pk=token)), 'rb') as part:
+            self.assertEqual(part.read(), self.data)
+
+    def test_missing_part_file_is_a_form_error(self):
+        token = self.start()
+        self.send(token, 0, self.data)
+        os.remove(upload_path(ChunkedUpload.objects.get(pk=token)))
+
+        response = self.client.post(reverse('blog_create'), {
+            'title': 'Lost upload', 'content': 'Body', 'category': 'other', 'upload_tokens': token,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no longer available', str(response.context['form'].errors['upload_tokens']))
+        self.assertFalse(BlogPost.objects.filter(title='Lost upload').exists())
+        self.assertFalse(ChunkedUpload.objects.filter(pk=token).exists())
+
+
+@override_settings(IMAGE_MAX_EDGE=100)
+class NormalizeImageTests(TestCase):
+    """Uploads are re-encoded upright, stripped and capped, in their own format"""
+
+    def encode(self, image, fmt, **options):
+        buffer = BytesIO()
+        image.save(buffer, fmt, **options)
+        buffer.seek(0)
+        return buffer
+
+    def decode(self, result):
+        data, ext = result
+        return Image.open(BytesIO(data)), ext
+
+    def test_small_clean_images_are_kept(self):
+        for fmt in ('PNG', 'JPEG', 'WEBP'):
+            with self.subTest(fmt=fmt):
+                self.assertIsNone(normalize_image(self.encode(Image.new('RGB', (80, 60), 'red'), fmt)))
+
+    def test_exif_orientation_is_applied_and_metadata_dropped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotate 90° clockwise
+        exif[0x010F] = 'Camera maker'
+        source = self.encode(Image.new('RGB', (80, 60), 'red'), 'JPEG', exif=exif, comment=b'hello')
+        image, ext = self.decode(normalize_image(source))
+        self.assertEqual((ext, image.size), ('jpg', (60, 80)))
+        self.assertEqual(dict(image.getexif()), {})
+        self.assertNotIn('comment', image.info)
+
+    def test_oversized_images_are_capped_in_their_own_format(self):
+        for fmt, ext, mode in [('PNG', 'png', 'RGBA'), ('WEBP', 'webp', 'RGB'), ('JPEG', 'jpg', 'RGB')]:
+            with self.subTest(fmt=fmt):
+                image, result_ext = self.decode(normalize_image(self.encode(Image.new(mode, (300, 150), 'blue'), fmt)))
+                self.assertEqual((result_ext, image.format, image.size), (ext, fmt, (100, 50)))
+                self.assertEqual(image.mode, mode)
+
+    def test_other_formats_become_jpeg_or_png(self):
+        image, ext = self.decode(normalize_image(self.encode(Image.new('RGB', (40, 30)), 'BMP')))
+        self.assertEqual((ext, image.format), ('jpg', 'JPEG'))
+        image, ext = self.decode(normalize_image(self.encode(Image.new('RGBA', (40, 30)), 'TIFF')))
+        self.assertEqual((ext, image.format), ('png', 'PNG'))
+
+    def test_animated_images_are_left_alone(self):
+        frames = [Image.new('RGB', (300, 300), color) for color in ('red', 'blue')]
+        source = self.encode(frames[0], 'GIF', save_all=True, append_images=frames[1:])
+        self.assertIsNone(normalize_image(source))
+
+    def test_large_jpegs_decode_in_draft_mode(self):
+        source = self.encode(Image.new('RGB', (1600, 800), 'green'), 'JPEG')
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as spy:
+            image, ext = self.decode(normalize_image(source))
+        spy.assert_called_once_with(mock.ANY, 'RGB', (100, 100))
+        self.assertEqual((ext, image.size), ('jpg', (100, 50)))
+
+
+class ServeMediaTests(MediaTestCase):
+    """Uploads are served with validators, byte ranges and safe content types"""
+
+    blob = 'blobs/ab/cd/' + 'abcd' * 16 + '.png'
+
+    def put(self, name, data):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def get(self, name, **headers):
+        response = self.client.get(reverse('serve_media', args=[name]), headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_ranges(self):
+        self.put('legacy/photo.png', b'0123456789')
+        response = self.get('legacy/photo.png', range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 2-5/10', '4'))
+        self.assertEqual(self.content(response), b'2345')
+
+        response = self.get('legacy/photo.png', range='bytes=-3')
+        self.assertEqual((response.status_code, self.content(response)), (206, b'789'))
+
+        response = self.get('legacy/photo.png', range='bytes=10-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+        # A stale If-Range gets the whole file instead of a piece of the new one
+        response = self.get('legacy/photo.png', range='bytes=2-5', if_range='"stale"')
+        self.assertEqual((response.status_code, self.content(response)), (200, b'0123456789'))
+
+    def test_etag_revalidation(self):
+        self.put('legacy/photo.png', b'0123456789')
+        etag = self.get('legacy/photo.png')['ETag']
+        response = self.get('legacy/photo.png', if_none_match=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(self.get('legacy/photo.png', if_none_match='"other"').status_code, 200)
+
+    def test_blobs_are_immutable(self):
+        self.put(self.blob, b'png bytes')
+        self.put('legacy/photo.png', b'png bytes')
+        self.assertEqual(self.get(self.blob)['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('immutable', self.get('legacy/photo.png')['Cache-Control'])
+
+    def test_only_raster_images_are_inline(self):
+        self.put('legacy/photo.png', b'png bytes')
+        self.put('legacy/drawing.svg', b'<svg onload="alert(1)"/>')
+        self.put('legacy/page.html', b'<script>alert(1)</script>')
+
+        response = self.get('legacy/photo.png')
+        self.assertEqual((response['Content-Type'], response['X-Content-Type-Options']), ('image/png', 'nosniff'))
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        for name in ('legacy/drawing.svg', 'legacy/page.html'):
+            with self.subTest(name=name):
+                response = self.get(name)
+                self.assertEqual(response['Content-Type'], 'application/octet-stream')
+                self.assertEqual(response['Content-Disposition'], 'attachment')
+                self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_paths_outside_media_root_are_not_found(self):
+        self.put('legacy/photo.png', b'png bytes')
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('legacy').status_code, 404)
+
+
+class RenditionTests(MediaTestCase):
+    """Renditions stop at the original's width and the srcset says so"""
+
+    media_settings = {'IMAGE_JOBS_ASYNC': False, 'IMAGE_RENDITION_WIDTHS': (320, 640, 1280)}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+
+    def upload_avatar(self, size):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.avatar = png('me.png', size=size)
+        profile.save()
+        profile.refresh_from_db()
+        return profile.avatar
+
+    def renditions(self, avatar):
+        return {
+            width: avatar.storage.exists(rendition_name(avatar.name, width, 'webp'))
+            for width in (320, 640, 1280)
+        }
+
+    def test_narrow_original_is_not_copied_at_larger_widths(self):
+        avatar = self.upload_avatar((400, 300))
+        self.assertEqual(self.renditions(avatar), {320: True, 640: False, 1280: False})
+        self.assertTrue(avatar.storage.exists(rendition_name(avatar.name, 320, 'png')))
+
+        html = responsive_image(avatar)
+        self.assertIn(f'{avatar.storage.url(rendition_name(avatar.name, 320, "webp"))} 320w', html)
+        self.assertIn(f'{avatar.url} 400w', html)
+        self.assertNotIn('640w', html)
+        self.assertNotIn('1280w', html)
+
+    def test_wide_original_gets_every_width(self):
+        avatar = self.upload_avatar((1600, 900))
+        self.assertEqual(self.renditions(avatar), {320: True, 640: True, 1280: True})
+        self.assertIn(f'{avatar.url} 1600w', responsive_image(avatar))
+
+    def test_rewriting_drops_copies_at_the_original_width_or_above(self):
+        avatar = self.upload_avatar((400, 300))
+        stale = rendition_name(avatar.name, 640, 'webp')
+        avatar.storage.save(stale, png())
+        write_renditions(Image.new('RGB', (400, 300)), avatar.name, avatar.storage)
+        self.assertFalse(avatar.storage.exists(stale))
+
+    def test_tiny_original_needs_no_renditions(self):
+        avatar = self.upload_avatar((200, 100))
+        self.assertEqual(self.renditions(avatar), {320: False, 640: False, 1280: False})
+        self.assertTrue(has_renditions(avatar))
+        self.assertIn(f'srcset="{avatar.url} 200w"', responsive_image(avatar))
+
+
+class ImageJobTests(MediaTestCase):
+    """The image job queue and what pages show while it works"""
+
+    media_settings = {'IMAGE_JOBS_ASYNC': True}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+
+    def setUp(self):
+        self.profile = UserProfile.objects.get(user=self.user)
+        self.profile.avatar = png('me.png', size=(400, 300))
+        self.profile.save()
+        self.job = ImageJob.objects.get(object_id=self.profile.pk, field_name='avatar')
+
+    def test_pending_image_shows_a_placeholder(self):
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.avatar_ready)
+        self.assertIn('Processing image', responsive_image(self.profile.avatar))
+
+    def test_final_failure_falls_back_to_the_original(self):
+        for attempt in range(MAX_ATTEMPTS):
+            finish_job(self.job, error='cannot identify image file')
+            self.profile.refresh_from_db()
+            self.assertEqual(self.profile.avatar_ready, attempt == MAX_ATTEMPTS - 1)
+        self.assertEqual(self.job.status, 'failed')
+
+        html = responsive_image(self.profile.avatar, alt='Me')
+        self.assertNotIn('Processing image', html)
+        self.assertNotIn('srcset', html)
+        self.assertIn(f'<img src="{self.profile.avatar.url}" alt="Me"', html)
+        self.assertIn('width="400" height="300"', html)
+
+    def test_only_jobs_past_their_lease_are_requeued(self):
+        self.assertEqual(claim_jobs(10), [self.job])
+        # A second worker starting up leaves the running job alone
+        self.assertEqual(release_stale_jobs(lease=60), 0)
+        self.assertEqual(claim_jobs(10), [])
+
+        ImageJob.objects.filter(pk=self.job.pk).update(updated_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(release_stale_jobs(lease=60), 1)
+        self.assertEqual(claim_jobs(10), [self.job])
+
+
+class MediaBlobTests(MediaTestCase):
+    """Identical uploads share one blob that goes away with its last reference"""
+
+    media_settings = {'IMAGE_JOBS_ASYNC': False, 'MEDIA_CONTENT_ADDRESSED': True}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'secret-pass')
+
+    def create_post(self, title, image):
+        return BlogPost.objects.create(title=title, content='Body', author=self.author, image=image)
+
+    def refcount(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('refcount', flat=True).first()
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.create_post('First', png('a.png', size=(400, 300)))
+        second = self.create_post('Second', png('b.png', size=(400, 300)))
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(name.startswith('blobs/'))
+        self.assertEqual(self.refcount(name), 2)
+
+        storage = first.image.storage
+        rendition = rendition_name(name, 320, 'webp')
+        self.assertTrue(storage.exists(rendition))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.refcount(name), 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.refcount(name))
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(rendition))
+
+    def test_upload_paths(self):
+        # Blob names carry their own hash shards
+        post = self.create_post('Blob', png('a.png'))
+        self.assertTrue(post.image.name.startswith('blobs/'))
+        upload_to = BlogPost._meta.get_field('image').upload_to
+        self.assertEqual(upload_to(post, 'photo.png'), 'blog_images/photo.png')
+        with override_settings(MEDIA_CONTENT_ADDRESSED=False):
+            name = upload_to(post, 'photo.png')
+        self.assertTrue(is_sharded('blog_images', name))
+
+    def test_replacing_an_image_moves_the_reference(self):
+        post = self.create_post('Post', png('a.png'))
+        old = post.image.name
+        post.image = png('b.png', 'blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertIsNone(self.refcount(old))
+        self.assertEqual(self.refcount(post.image.name), 1)
+        self.assertFalse(post.image.storage.exists(old))
+
+    def test_gallery_references_are_counted_and_released_in_bulk(self):
+        post = self.create_post('Post', png('cover.png'))
+        cover = post.image.name
+        # The second gallery image repeats the cover's bytes
+        images = add_gallery_images(post, [png('a.png', 'blue'), png('cover.png'), png('c.png', 'green')])
+        self.assertEqual(self.refcount(cover), 2)
+        self.assertEqual(self.refcount(images[0].image.name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(5):
+                # SELECT, DELETE, and three queries for every blob together
+                remove_gallery_images(post, [image.id for image in images])
+        self.assertEqual(self.refcount(cover), 1)
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        self.assertFalse(post.image.storage.exists(images[0].image.name))
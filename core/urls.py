@@ -1,8 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
-from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -13,10 +11,18 @@ urlpatterns = [
     path('blog/<slug:slug>/', views.BlogDetailView.as_view(), name='blog_detail'),
     path('blog/<slug:slug>/edit/', views.BlogUpdateView.as_view(), name='blog_update'),
     path('blog/<slug:slug>/delete/', views.BlogDeleteView.as_view(), name='blog_delete'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:token>/', views.upload_chunk, name='upload_chunk'),
+    path('blog/<slug:slug>/gallery/', views.gallery_add, name='gallery_add'),
+    path('blog/<slug:slug>/gallery/reorder/', views.gallery_reorder, name='gallery_reorder'),
+    path('blog/<slug:slug>/gallery/remove/', views.gallery_remove, name='gallery_remove'),
     path('blog/<slug:slug>/bookmark/', views.toggle_bookmark, name='toggle_bookmark'),
     path('blog/<slug:slug>/vote/', views.vote_post, name='vote_post'),
     path('blog/<slug:slug>/comment/', views.add_comment, name='add_comment'),
+    path('blog/<slug:slug>/comments/', views.comment_list, name='comment_list'),
+    path('api/post-states/', views.post_states, name='post_states'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('profile/', views.profile, name='profile'),
     path('profile/<str:username>/', views.user_profile, name='user_profile'),
     path('auth/', views.auth_view, name='auth'),
@@ -24,6 +30,3 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(next_page='home'), name='logout'),
     path('suggestion/', views.suggestion_form, name='suggestion_form'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -4,19 +4,32 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
 from django.http import JsonResponse, Http404
+from django.template.loader import render_to_string
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth import login, authenticate
-from django.db.models import Q
+from django.contrib.auth import login
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
 import requests
 import json
-from .models import BlogPost, UserProfile, Bookmark, BlogImage, Vote, Comment
+import mimetypes
+from .storage import is_content_addressed
+from .models import BlogPost, UserProfile, Bookmark, Comment, ChunkedUpload
 from django.contrib.auth.models import User
-from .forms import BlogPostForm, UserProfileForm, CustomUserCreationForm, CommentForm
+from .forms import BlogPostForm, UserProfileForm, CustomUserCreationForm, CommentForm, GalleryImagesForm
 from .services.api import APIClient
+from .services.search import get_search_backend
+from .services.pagination import KeysetPaginator
+from .services.comments import get_comment_page
+from .services.votes import toggle_vote
+from .services.engagement import get_post_states, attach_post_states, MAX_STATE_POSTS
+from .services.gallery import add_gallery_images, reorder_gallery_images, remove_gallery_images
+from .services.fileserving import INLINE_UPLOAD_TYPES, serve_file, precompressed_variant
+from .services.uploads import UploadError, OffsetMismatch, start_upload, append_chunk, open_uploads, discard_upload, chunk_size
 
 def home(request):
-    posts = BlogPost.objects.all().order_by('-created_at')[:6]
+    posts = BlogPost.objects.select_related('author').defer('content').order_by('-created_at')[:6]
     return render(request, 'core/home.html', {'posts': posts})
 
 def about(request):
@@ -42,16 +55,10 @@ def auth_view(request):
         if action == 'login':
             login_form = AuthenticationForm(request, data=request.POST)
             if login_form.is_valid():
-                username = login_form.cleaned_data.get('username')
-                password = login_form.cleaned_data.get('password')
-                
-                user = authenticate(request, username=username, password=password)
-                if user is not None:
-                    login(request, user)
-                    messages.success(request, 'Successfully logged in!')
-                    return redirect('home')
-                else:
-                    messages.error(request, 'Invalid username or password.')
+                # The form already authenticated the user; don't hash the password twice
+                login(request, login_form.get_user())
+                messages.success(request, 'Successfully logged in!')
+                return redirect('home')
             
         elif action == 'register':
             register_form = CustomUserCreationForm(request.POST)
@@ -82,30 +89,35 @@ class BlogListView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('author').defer('content')
         search_query = self.request.GET.get('search', '')
         category = self.request.GET.get('category', '')
         
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(content__icontains=search_query)
-            )
+            queryset = get_search_backend().filter(queryset, search_query)
         
         if category:
             queryset = queryset.filter(category=category)
         
         return queryset
 
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('search', '')
         context['selected_category'] = self.request.GET.get('category', '')
         context['categories'] = BlogPost.CATEGORY_CHOICES
+        if self.request.user.is_authenticated:
+            attach_post_states(self.request.user, context['posts'])
         return context
 
 class BlogDetailView(DetailView):
     model = BlogPost
+    queryset = BlogPost.objects.select_related('author')
     template_name = 'core/blog_detail.html'
     context_object_name = 'object'
 
@@ -113,16 +125,11 @@ class BlogDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         
         if self.request.user.is_authenticated:
-            context['is_bookmarked'] = Bookmark.objects.filter(
-                user=self.request.user,
-                post=self.object
-            ).exists()
-            context['user_vote'] = Vote.objects.filter(
-                user=self.request.user,
-                post=self.object
-            ).first()
+            attach_post_states(self.request.user, [self.object])
+            context['is_bookmarked'] = self.object.is_bookmarked
+            context['has_life'] = self.object.has_life
             
-        context['comments'] = self.object.comments.filter(parent=None)
+        context['comments'] = get_comment_page(self.object)
         context['comment_form'] = CommentForm()
         return context
 
@@ -131,24 +138,22 @@ class BlogCreateView(LoginRequiredMixin, CreateView):
     form_class = BlogPostForm
     template_name = 'core/blog_form.html'
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         form.instance.author = self.request.user
         try:
             response = super().form_valid(form)
             
             # Handle additional images
-            images = self.request.FILES.getlist('images')
+            images = form.cleaned_data['images']
             captions = form.cleaned_data.get('image_captions', '').split('\n')
             captions = [cap.strip() for cap in captions if cap.strip()]
-            
-            for i, image in enumerate(images):
-                caption = captions[i] if i < len(captions) else ''
-                BlogImage.objects.create(
-                    post=self.object,
-                    image=image,
-                    caption=caption,
-                    order=i
-                )
+            with open_uploads(form.cleaned_data['upload_tokens']) as uploaded:
+                add_gallery_images(self.object, images + uploaded, captions)
             messages.success(self.request, 'Blog post created successfully!')
             return response
                 
@@ -161,40 +166,48 @@ class BlogUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     form_class = BlogPostForm
     template_name = 'core/blog_form.html'
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         form.instance.author = self.request.user
         response = super().form_valid(form)
         
         # Handle image updates
-        images = self.request.FILES.getlist('images')
+        images = form.cleaned_data['images']
         captions = form.cleaned_data.get('image_captions', '').split('\n')
         captions = [cap.strip() for cap in captions if cap.strip()]
         
         # Delete existing images if replace_images is checked
         if form.cleaned_data.get('replace_images'):
-            BlogImage.objects.filter(post=self.object).delete()
+            remove_gallery_images(self.object)
         
-        # Add new images
-        for i, image in enumerate(images):
-            caption = captions[i] if i < len(captions) else ''
-            BlogImage.objects.create(
-                post=self.object,
-                image=image,
-                caption=caption,
-                order=i + self.object.blogimage_set.count()
-            )
+        # Add new images after the existing ones
+        try:
+            with open_uploads(form.cleaned_data['upload_tokens']) as uploaded:
+                add_gallery_images(self.object, images + uploaded, captions)
+        except UploadError as e:
+            form.add_error('upload_tokens', str(e))
+            return self.form_invalid(form)
         messages.success(self.request, 'Blog post updated successfully!')
         return response
 
     def test_func(self):
-        post = self.get_object()
-        return self.request.user == post.author
+        return self.get_object().author_id == self.request.user.id
 
 class BlogDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = BlogPost
     template_name = 'core/blog_confirm_delete.html'
     success_url = '/'
 
+    def get_object(self, queryset=None):
+        # test_func and post() both ask for the post; fetch it once
+        if not hasattr(self, '_post'):
+            self._post = super().get_object(queryset)
+        return self._post
+
     def delete(self, request, *args, **kwargs):
         self.object = self.get_object()
         success_url = self.get_success_url()
@@ -203,8 +216,114 @@ class BlogDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return redirect(success_url)
 
     def test_func(self):
-        post = self.get_object()
-        return self.request.user == post.author
+        return self.get_object().author_id == self.request.user.id
+
+def get_own_post(request, slug):
+    """The post with `slug` if the current user wrote it, else None"""
+    post = get_object_or_404(BlogPost.objects.only('id', 'author_id'), slug=slug)
+    return post if post.author_id == request.user.id else None
+
+@login_required
+def gallery_add(request, slug):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    post = get_own_post(request, slug)
+    if post is None:
+        return JsonResponse({'error': 'Only the author can edit this gallery'}, status=403)
+
+    form = GalleryImagesForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'error': ' '.join(form.errors.get('images', ['Invalid images']))}, status=400)
+    captions = request.POST.getlist('captions')
+    images = add_gallery_images(post, form.cleaned_data['images'], captions)
+    return JsonResponse({
+        'images': [
+            {'id': image.id, 'caption': image.caption, 'order': image.order}
+            for image in images
+        ]
+    })
+
+@login_required
+def gallery_reorder(request, slug):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    post = get_own_post(request, slug)
+    if post is None:
+        return JsonResponse({'error': 'Only the author can edit this gallery'}, status=403)
+    try:
+        image_ids = [int(image_id) for image_id in json.loads(request.body).get('order', [])]
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    if not reorder_gallery_images(post, image_ids):
+        return JsonResponse({'error': 'Order must list each image of this gallery exactly once'}, status=400)
+    return JsonResponse({'status': 'success'})
+
+@login_required
+def gallery_remove(request, slug):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    post = get_own_post(request, slug)
+    if post is None:
+        return JsonResponse({'error': 'Only the author can edit this gallery'}, status=403)
+    try:
+        image_ids = [int(image_id) for image_id in json.loads(request.body).get('ids', [])]
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    deleted = remove_gallery_images(post, image_ids)
+    return JsonResponse({'status': 'success', 'deleted': deleted})
+
+def upload_state(upload):
+    return {
+        'token': str(upload.id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': upload.status == 'complete',
+    }
+
+@login_required
+def upload_start(request):
+    """Reserve a chunked image upload; the returned token goes to the post form"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    try:
+        data = json.loads(request.body)
+        upload = start_upload(request.user, data.get('filename'), data.get('size'))
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({**upload_state(upload), 'chunk_size': chunk_size()}, status=201)
+
+@login_required
+def upload_chunk(request, token):
+    """GET reports the stored offset, PATCH appends a part there, DELETE cancels.
+
+    A PATCH body is the raw bytes of one part, with its position in the
+    Upload-Offset header; it is streamed to disk rather than read whole.
+    """
+    upload = get_object_or_404(ChunkedUpload, pk=token, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(upload_state(upload))
+    if request.method == 'DELETE':
+        discard_upload(upload)
+        return JsonResponse({'status': 'success'})
+    if request.method != 'PATCH':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+    try:
+        upload = append_chunk(upload, offset, request, length)
+    except OffsetMismatch as e:
+        return JsonResponse({'error': str(e), 'offset': e.offset}, status=e.status)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse(upload_state(upload))
 
 @login_required
 def toggle_bookmark(request, slug):
@@ -221,27 +340,26 @@ def toggle_bookmark(request, slug):
 @login_required
 def vote_post(request, slug):
     if request.method == 'POST':
-        post = get_object_or_404(BlogPost, slug=slug)
-        vote, created = Vote.objects.get_or_create(
-            user=request.user,
-            post=post,
-            defaults={'is_life': True}
-        )
-        
-        if not created:
-            vote.is_life = not vote.is_life
-            vote.save()
-        
-        # Update post votes count
-        post.votes = Vote.objects.filter(post=post, is_life=True).count()
-        post.save()
+        post = get_object_or_404(BlogPost.objects.only('id'), slug=slug)
+        votes, has_life = toggle_vote(request.user, post)
         
         return JsonResponse({
-            'votes': post.votes,
-            'has_life': vote.is_life
+            'votes': votes,
+            'has_life': has_life
         })
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+@login_required
+def post_states(request):
+    """Bookmark and life state for a batch of posts given as ?ids= and/or ?slugs="""
+    ids = [value for value in request.GET.get('ids', '').split(',') if value.isdigit()]
+    slugs = [value for value in request.GET.get('slugs', '').split(',') if value]
+    if len(ids) + len(slugs) > MAX_STATE_POSTS:
+        return JsonResponse({'error': f'At most {MAX_STATE_POSTS} posts per request'}, status=400)
+
+    states = get_post_states(request.user, ids=[int(value) for value in ids], slugs=slugs)
+    return JsonResponse({'posts': {str(key): state for key, state in states.items()}})
+
 @login_required
 def add_comment(request, slug):
     post = get_object_or_404(BlogPost, slug=slug)
@@ -255,7 +373,7 @@ def add_comment(request, slug):
                 comment.author = request.user
                 parent_id = data.get('parent_id')
                 if parent_id:
-                    parent_comment = Comment.objects.get(id=parent_id)
+                    parent_comment = Comment.objects.get(id=parent_id, post=post)
                     comment.parent = parent_comment
                 
                 comment.save()
@@ -273,6 +391,24 @@ def add_comment(request, slug):
             return JsonResponse({'error': 'Parent comment not found'}, status=404)
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+def comment_page_response(request, page):
+    """Render a page of comments as an HTML fragment plus its next cursor"""
+    return JsonResponse({
+        'html': render_to_string('core/comment_page.html', {'comments': page}, request=request),
+        'has_next': page.has_next(),
+        'next_cursor': page.next_cursor,
+    })
+
+def comment_list(request, slug):
+    post = get_object_or_404(BlogPost.objects.only('id'), slug=slug)
+    page = get_comment_page(post, cursor=request.GET.get('cursor'))
+    return comment_page_response(request, page)
+
+def comment_replies(request, comment_id):
+    parent = get_object_or_404(Comment.objects.only('id'), id=comment_id)
+    page = get_comment_page(parent=parent, cursor=request.GET.get('cursor'))
+    return comment_page_response(request, page)
+
 @login_required
 def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id, author=request.user)
@@ -292,8 +428,13 @@ def profile(request):
     else:
         form = UserProfileForm(instance=profile)
     
-    user_posts = BlogPost.objects.filter(author=request.user).order_by('-created_at')
-    bookmarks = Bookmark.objects.filter(user=request.user).order_by('-created_at')
+    user_posts = KeysetPaginator(
+        BlogPost.objects.filter(author=request.user).defer('content'), 10
+    ).page(request.GET.get('posts_cursor'))
+    bookmarks = KeysetPaginator(
+        Bookmark.objects.filter(user=request.user)
+        .select_related('post__author').defer('post__content'), 10
+    ).page(request.GET.get('bookmarks_cursor'))
     
     return render(request, 'core/profile.html', {
         'form': form,
@@ -312,10 +453,17 @@ def user_profile(request, username):
         'website': bool(profile.website)
     }
     profile_completion = (sum(completion_fields.values()) / len(completion_fields)) * 100
+
+    posts = KeysetPaginator(
+        BlogPost.objects.filter(author=user).defer('content'), 10
+    ).page(request.GET.get('cursor'))
+    if request.user.is_authenticated:
+        attach_post_states(request.user, posts)
     
     return render(request, 'core/user_profile.html', {
         'profile': profile,
-        'profile_completion': profile_completion
+        'profile_completion': profile_completion,
+        'posts': posts
     })
 
 def help_center(request):
@@ -395,3 +543,34 @@ def suggestion_form(request):
                 'message': 'Could not connect to the server. Please try again later.'
             }, status=503)
     return render(request, 'core/suggestion_form.html')
+
+@require_safe
+def serve_media(request, path):
+    """Uploaded files, with Range/ETag support and sendfile hand-off.
+
+    Content-addressed blobs are cached as immutable; everything else
+    (legacy uploads, renditions that may be regenerated) is revalidated.
+    Only raster images are shown inline; anything else is a download.
+    """
+    return serve_file(
+        request, settings.MEDIA_ROOT, path, immutable=is_content_addressed(path),
+        inline_types=INLINE_UPLOAD_TYPES
+    )
+
+@require_safe
+def serve_static(request, path):
+    """Collected static files, preferring a precompressed .br/.gz sibling.
+
+    Manifest-hashed names are cached as immutable; the unhashed originals
+    are revalidated.
+    """
+    serve_path, coding = precompressed_variant(settings.STATIC_ROOT, path, request.headers.get('Accept-Encoding'))
+    content_type = None
+    if coding:
+        # The sibling's extension only names the coding; the type is the original's
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    immutable = path in getattr(staticfiles_storage, 'hashed_names', ())
+    return serve_file(
+        request, settings.STATIC_ROOT, serve_path, immutable=immutable,
+        content_type=content_type, content_encoding=coding, vary='Accept-Encoding'
+    )
@@ -74,6 +74,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.QueryBudgetMiddleware",
 ]
 
 ROOT_URLCONF = "writoria.urls"
@@ -146,10 +147,181 @@ STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Outside DEBUG, collectstatic writes content-hashed names plus .gz/.br
+# siblings (core.storage.CompressedManifestStaticFilesStorage; .br needs
+# the optional `brotli` package) and core.views.serve_static serves them
+# with Accept-Encoding negotiation and immutable caching.
+STATIC_HASHED = not DEBUG
+STATIC_SERVE = True
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "core.storage.CompressedManifestStaticFilesStorage" if STATIC_HASHED
+            else "django.contrib.staticfiles.storage.StaticFilesStorage"
+        ),
+    },
+}
+
 # Media files (Uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Serve MEDIA_URL through core.views.serve_media (Range, ETag, immutable
+# caching for content-addressed blobs). With FILE_SENDFILE_BACKEND set to
+# 'x-sendfile' or 'x-accel-redirect' Django only checks the request and the
+# front-end server streams the file; for nginx, map each served root to an
+# `internal` location in FILE_ACCEL_REDIRECT_LOCATIONS.
+MEDIA_SERVE = True
+FILE_CACHE_MAX_AGE = 3600
+FILE_SENDFILE_BACKEND = None
+FILE_ACCEL_REDIRECT_LOCATIONS = {
+    str(MEDIA_ROOT): '/protected-media/',
+}
+
+# Store uploads once per distinct content under media/blobs/ (core.storage).
+# Blob names are sharded by hash; with this off, uploads are sharded by
+# ShardedUploadTo instead
+MEDIA_CONTENT_ADDRESSED = True
+
+# Uploads are re-encoded on ingest: auto-oriented, stripped of EXIF and
+# scaled down so the longest edge is at most IMAGE_MAX_EDGE pixels
+IMAGE_MAX_EDGE = 2560
+IMAGE_INGEST_QUALITY = 85
+
+# Responsive renditions written next to every uploaded image
+IMAGE_RENDITION_WIDTHS = (320, 640, 1280)
+IMAGE_RENDITION_QUALITY = 80
+# Limits for post image uploads. Large images go through the chunked
+# upload API (core.services.uploads), which streams parts of at most
+# UPLOAD_CHUNK_SIZE bytes into CHUNKED_UPLOAD_ROOT and checks dimensions
+# from the image header before anything is decoded.
+UPLOAD_MAX_FILE_SIZE = 10 * 1024 * 1024
+UPLOAD_MAX_FILES = 20
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_IMAGE_DIMENSION = 8000
+UPLOAD_MAX_IMAGE_PIXELS = 40_000_000
+UPLOAD_EXPIRY_HOURS = 24
+CHUNKED_UPLOAD_ROOT = BASE_DIR / 'uploads'
+# Whole-form uploads: the featured image plus UPLOAD_MAX_FILES gallery images
+DATA_UPLOAD_MAX_NUMBER_FILES = UPLOAD_MAX_FILES + 1
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 * 1024 * 1024
+
+# Queue image work for `manage.py process_image_jobs`; False runs it inline
+IMAGE_JOBS_ASYNC = True
+# A job still in processing this many seconds after its claim is assumed
+# to belong to a dead worker and is requeued; keep it above a batch's run time
+IMAGE_JOB_LEASE = 15 * 60
+
+# Ollama (chat.clients): one pooled client per process, with timeouts so a
+# hung model server cannot pin a worker, and keep_alive so the model stays
+# loaded between requests
+OLLAMA_HOST = 'http://localhost:11434'
+OLLAMA_MODEL = 'llama3:8b'
+OLLAMA_CONNECT_TIMEOUT = 5.0
+OLLAMA_READ_TIMEOUT = 120.0
+OLLAMA_POOL_SIZE = 10
+OLLAMA_KEEP_ALIVE = '30m'
+
+# Shared reply cache for generic chat prompts (chat.cache): an in-process
+# LRU in front of the ChatCacheEntry table. Prompts that mention the user or
+# their own work are never cached. Changing the system prompt or model
+# invalidates every entry.
+CHAT_CACHE_ENABLED = True
+CHAT_CACHE_TTL = 7 * 24 * 3600
+CHAT_CACHE_MEMORY_ENTRIES = 500
+CHAT_CACHE_DB_ENTRIES = 10000
+CHAT_CACHE_MAX_PROMPT_LENGTH = 300
+# Each worker logs its hit/miss counters to chat.cache every this many lookups
+CHAT_CACHE_METRICS_EVERY = 1000
+
+# Semantic layer on top (chat.semantic, needs NumPy): prompts that miss the
+# exact cache are embedded and reuse the reply to a cached paraphrase whose
+# cosine similarity reaches the threshold. The index is a memory-mapped file
+# compacted every CHAT_SEMANTIC_COMPACT_EVERY appends.
+# 'chat.semantic.HashingEmbedder' is a local stand-in for tests.
+CHAT_SEMANTIC_CACHE = False
+CHAT_SEMANTIC_EMBEDDER = 'chat.semantic.OllamaEmbedder'
+CHAT_EMBED_MODEL = 'nomic-embed-text'
+CHAT_SEMANTIC_THRESHOLD = 0.92
+CHAT_SEMANTIC_INDEX_DIR = BASE_DIR / 'chat_index'
+CHAT_SEMANTIC_COMPACT_EVERY = 1000
+
+# Per-URL-name query budgets, checked by core.middleware.QueryBudgetMiddleware
+# (logs a warning, or raises when QUERY_BUDGET_STRICT) and by
+# core.services.querybudget.assert_query_budget in tests. Budgets include
+# the session and user lookups that every authenticated request makes.
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_STRICT = False
+QUERY_REPEAT_THRESHOLD = 3
+QUERY_BUDGETS = {
+    'home': 4,
+    'about': 2,
+    'team': 2,
+    'blog_list': 7,
+    'blog_create': 20,
+    'blog_detail': 8,
+    'blog_update': 20,
+    # Deleting cascades to bookmarks, votes, gallery images and the search
+    # index, then releases the post's blob references: three queries for
+    # any number of gallery images
+    'blog_delete': 13,
+    'serve_media': 0,
+    'serve_static': 0,
+    'upload_start': 5,
+    'upload_chunk': 6,
+    'gallery_add': 12,
+    'gallery_reorder': 6,
+    'gallery_remove': 10,
+    # Adding a bookmark inserts it under get_or_create's savepoint
+    'toggle_bookmark': 7,
+    # A first vote inserts its row under a savepoint (SAVEPOINT, INSERT,
+    # RELEASE) inside the toggle transaction, so a racing first click
+    # cannot abort the counter update
+    'vote_post': 11,
+    'post_states': 4,
+    'add_comment': 5,
+    'comment_list': 4,
+    'comment_replies': 4,
+    'delete_comment': 6,
+    # An avatar upload also queues its image job (inline: marks it ready)
+    'profile': 9,
+    'user_profile': 8,
+    # Logging in inserts the session under a savepoint, stamps last_login
+    # and saves the success message back to the session
+    'auth': 9,
+    'help_center': 2,
+    # Flushing the session loads it again before deleting it
+    'logout': 4,
+    'suggestion_form': 2,
+    'chat:chat_response': 9,
+    'chat:chat_stream': 5,
+    'chat:chat_response_async': 9,
+    'chat:chat_stream_async': 4,
+}
+
+# Buffer vote counter updates in-process and flush them every N seconds
+# (reconcile_votes must not run while any worker still holds deltas)
+VOTE_BUFFER_ENABLED = False
+VOTE_BUFFER_FLUSH_INTERVAL = 5
+
+# Full-text search for the blog list; IContainsBackend works on any database
+BLOG_SEARCH_BACKEND = 'core.services.search.SQLiteFTSBackend'
+
+# Send the chat cache's periodic hit/miss counters to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'chat.cache': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
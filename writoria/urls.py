@@ -16,12 +16,26 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from core.views import serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
     path('chat/', include('chat.urls', namespace='chat')),
-] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.STATIC_SERVE:
+    # Collected files from STATIC_ROOT with precompressed variants; in
+    # DEBUG, runserver serves STATIC_URL from the finders before this
+    urlpatterns += [
+        re_path(rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.+)$', serve_static, name='serve_static'),
+    ]
+
+if settings.MEDIA_SERVE:
+    # Served by Django (or handed to the front-end server via sendfile)
+    # in production as well, unlike django.conf.urls.static
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.+)$', serve_media, name='serve_media'),
+    ]